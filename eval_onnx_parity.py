@@ -0,0 +1,57 @@
+import argparse
+from mkr.benchmark import RetrievalBenchmark
+from mkr.resources.resource_manager import ResourceManager
+from mkr.models.retrieval.onnx_backend import check_embedding_parity
+from mkr.retrievers.dense_retriever import DenseRetriever, DenseRetrieverConfig
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", type=str, default="mE5")
+    parser.add_argument("--model_checkpoint", type=str, default=None)
+    parser.add_argument("--query_backend", type=str, default="onnx_int8")
+    parser.add_argument("--corpus_name", type=str, default="thaiqa_squad")
+    parser.add_argument("--dataset_path", type=str, default="./datasets/thai_retrieval/thaiqa_squad")
+    parser.add_argument("--batch_size", type=int, default=32)
+    args = parser.parse_args()
+
+    database_path = f"./database/{args.model_name}/{args.model_checkpoint}"
+    # Passages are encoded once with PyTorch, both retrievers share the same database
+    torch_retrieval = DenseRetriever(
+        DenseRetrieverConfig(
+            model_name=args.model_name,
+            model_checkpoint=args.model_checkpoint,
+            database_path=database_path,
+        ),
+    )
+    torch_retrieval.add_corpus(args.corpus_name, f"{args.dataset_path}/corpus.jsonl", batch_size=args.batch_size)
+    onnx_retrieval = DenseRetriever(
+        DenseRetrieverConfig(
+            model_name=args.model_name,
+            model_checkpoint=args.model_checkpoint,
+            database_path=database_path,
+            query_backend=args.query_backend,
+        ),
+    )
+
+    resource_management = ResourceManager()
+    qrels = RetrievalBenchmark(resource_management, torch_retrieval).get_qrels(args.dataset_path, split="test")
+    questions = [qrel["question"] for qrel in qrels]
+
+    # Compare query embeddings
+    parity = check_embedding_parity(
+        torch_retrieval.encode_queries(questions, batch_size=args.batch_size),
+        onnx_retrieval.encode_queries(questions, batch_size=args.batch_size),
+    )
+    # Compare retrieval metrics
+    torch_results = RetrievalBenchmark(resource_management, torch_retrieval).evaluate_on_dataset(args.corpus_name, qrels, batch_size=args.batch_size)
+    onnx_results = RetrievalBenchmark(resource_management, onnx_retrieval).evaluate_on_dataset(args.corpus_name, qrels, batch_size=args.batch_size)
+
+    # Report results
+    print("*" * 50)
+    print(f"Query backend: {args.query_backend.upper()}")
+    for key, value in parity.items():
+        print(f"{key}: {value:.4f}")
+    for key in torch_results:
+        print(f"{key}: torch {torch_results[key] * 100:.1f} / {args.query_backend} {onnx_results[key] * 100:.1f} ({(onnx_results[key] - torch_results[key]) * 100:+.1f})")
+    print("*" * 50)
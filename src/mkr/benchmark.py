@@ -47,14 +47,17 @@ class RetrievalBenchmark:
                 qrels.append(json.loads(line))
         return qrels
 
-    def evaluate_on_dataset(self, corpus_name: str, qrels: List[Dict[str, List[str]]]) -> Dict[str, float]:
+    def evaluate_on_dataset(self, corpus_name: str, qrels: List[Dict[str, List[str]]], batch_size: int = 32) -> Dict[str, float]:
         # Intiial metrics
         metrics = RetrievalMetrics()
-        for qrel in tqdm(qrels, desc="Evaluating"):
-            question = qrel["question"]
-            gold_document_ids = set(qrel["context_ids"])
+        # Retrieve documents for a batch of questions at once
+        topk_resultss = []
+        for batch_idx in tqdm(range(math.ceil(len(qrels) / batch_size)), desc="Retrieving"):
+            batch_questions = [qrel["question"] for qrel in qrels[batch_idx * batch_size: (batch_idx + 1) * batch_size]]
+            topk_resultss.extend(self.retriever.batch_search(corpus_name, batch_questions, top_k=1000))
 
-            topk_results = self.retriever(corpus_name, query=question, top_k=1000)
+        for qrel, topk_results in tqdm(zip(qrels, topk_resultss), total=len(qrels), desc="Evaluating"):
+            gold_document_ids = set(qrel["context_ids"])
             retrieved_doc_ids = [result["id"] for result in topk_results]
 
             is_hit = False
@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import uuid
+import weakref
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Any, Tuple
+from mkr.databases.tombstones import Tombstones
+from mkr.databases.passage_store import PassageStore, PassageView, get_ids_memory_usage
+
+
+def get_array_memory_usage(array: np.ndarray) -> int:
+    # Memory-mapped arrays live in the (shared, reclaimable) page cache and are not counted
+    if array is None:
+        return 0
+    base = array
+    while isinstance(base, np.ndarray):
+        if isinstance(base, np.memmap):
+            return 0
+        base = base.base
+    return array.nbytes
+
+
+def save_json(data, file_path: str):
+    # Unchanged files are not rewritten, changed ones are swapped in whole (readers never see a partial file)
+    if os.path.exists(file_path):
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                if json.load(f) == data:
+                    return
+        except ValueError:
+            pass
+    with open(file_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(file_path + ".tmp", file_path)
+
+
+class Collection:
+    # Ids of the documents, their rows in the passage store and the deleted rows, shared by all collection types
+    def __init__(self, collection_path: str, passage_store: PassageStore = None):
+        self.collection_path = collection_path
+        # Passage contents and metadatas live in the (shared) passage store, the collection keeps its ids and their rows
+        self.passage_store = passage_store if passage_store is not None else PassageStore.open(os.path.join(collection_path, "passage_store"))
+        # Initial parameters
+        self.ids = []
+        self.rows = []              # Passage store row of each document
+        self.indexing = {}          # {id: row}, deleted rows are not indexed
+        self.tombstones = Tombstones()
+        self.num_saved_ids = 0      # Ids (and rows) already written to disk, later ones are appended on save
+        self.num_saved_id_bytes = 0
+        self.corpus_changed = False
+        # Content version, changes whenever documents are added or deleted (used to invalidate cached results)
+        self.version = uuid.uuid4().hex
+
+    @property
+    def contents(self) -> PassageView:
+        return PassageView(self.passage_store.contents, self.rows)
+
+    @property
+    def metadatas(self) -> PassageView:
+        return PassageView(self.passage_store.metadatas, self.rows)
+
+    def _add_passages(self, ids: List[str], contents: List[str], metadatas: List[Dict[str, Any]]) -> List[int]:
+        # Returns the positions (in ids) of the added documents, ids already in the collection are skipped
+        new_indices = []
+        for index, content_id in enumerate(ids):
+            if content_id in self.indexing:
+                continue
+            new_indices.append(index)
+            self.ids.append(content_id)
+            self.indexing[content_id] = len(self.ids) - 1
+        if len(new_indices) > 0:
+            self.rows.extend(self.passage_store.add([contents[index] for index in new_indices], [metadatas[index] for index in new_indices]))
+            self.corpus_changed = True
+            self.version = uuid.uuid4().hex
+        return new_indices
+
+    def add(self, ids: List[str], *args, **kwargs):
+        raise NotImplementedError
+
+    def delete(self, content_ids: List[str]):
+        # Mark rows as deleted, they are skipped at search time and reclaimed by compact()
+        rows = [self.indexing.pop(content_id) for content_id in content_ids if content_id in self.indexing]
+        if len(rows) > 0:
+            self.tombstones.delete(rows)
+            self.corpus_changed = True
+            self.version = uuid.uuid4().hex
+
+    def upsert(self, ids: List[str], *args, **kwargs):
+        # Replace existing documents (the old rows become tombstones) and add new ones, takes the arguments of add()
+        self.delete(ids)
+        self.add(ids, *args, **kwargs)
+
+    def _compact_passages(self, keep_indices: np.ndarray):
+        # Drop the deleted rows, remaining rows keep their order (the stored ids and rows are rewritten on save)
+        self.ids = [self.ids[index] for index in keep_indices]
+        self.rows = [self.rows[index] for index in keep_indices]
+        self.indexing = {content_id: row for row, content_id in enumerate(self.ids)}
+        self.tombstones.clear()
+        self.num_saved_ids = 0
+        self.corpus_changed = True
+        self.version = uuid.uuid4().hex
+
+    def get_indices(self, content_ids: List[str]) -> np.ndarray:
+        # Resolve ids to rows using the id-to-row index
+        try:
+            return np.fromiter((self.indexing[content_id] for content_id in content_ids), dtype=np.int64, count=len(content_ids))
+        except KeyError as e:
+            raise ValueError(f"Unknown id: {e.args[0]}")
+
+    def _get_passages_memory_usage(self) -> int:
+        # Approximate resident bytes of the ids and rows (the shared passages are not counted)
+        return get_ids_memory_usage(self.ids) + sys.getsizeof(self.rows) + sys.getsizeof(self.indexing)
+
+    def has_unsaved_changes(self) -> bool:
+        return self.corpus_changed
+
+    def _save_passages(self):
+        # Passages are saved to the store first, so the saved rows always resolve
+        self.passage_store.save()
+        rows_path = os.path.join(self.collection_path, "rows.bin")
+        ids_path = os.path.join(self.collection_path, "ids.jsonl")
+        if self.num_saved_ids > 0 and os.path.exists(rows_path) and os.path.exists(ids_path) and \
+                os.path.getsize(rows_path) >= self.num_saved_ids * 8 and os.path.getsize(ids_path) >= self.num_saved_id_bytes:
+            # Append only the new ids and rows, after dropping any left by an interrupted save
+            with open(rows_path, "r+b") as f:
+                f.truncate(self.num_saved_ids * 8)
+                f.seek(self.num_saved_ids * 8)
+                np.asarray(self.rows[self.num_saved_ids:], dtype=np.int64).tofile(f)
+            with open(ids_path, "r+b") as f:
+                f.truncate(self.num_saved_id_bytes)
+                f.seek(self.num_saved_id_bytes)
+                self.num_saved_id_bytes += self._write_ids(f, self.num_saved_ids)
+        else:
+            with open(rows_path + ".tmp", "wb") as f:
+                np.asarray(self.rows, dtype=np.int64).tofile(f)
+            os.replace(rows_path + ".tmp", rows_path)
+            with open(ids_path + ".tmp", "wb") as f:
+                self.num_saved_id_bytes = self._write_ids(f, 0)
+            os.replace(ids_path + ".tmp", ids_path)
+        self.num_saved_ids = len(self.ids)
+        self.tombstones.save(os.path.join(self.collection_path, "tombstones.npy"))
+
+    def _write_ids(self, f, start_index: int) -> int:
+        # Returns the number of bytes written
+        data = "".join(json.dumps(content_id, ensure_ascii=False) + "\n" for content_id in self.ids[start_index:]).encode("utf-8")
+        f.write(data)
+        return len(data)
+
+    def _load_passages(self, num_rows: int = None) -> bool:
+        # Load the saved ids and rows (at most num_rows), returns False if there are none
+        rows_path = os.path.join(self.collection_path, "rows.bin")
+        ids_path = os.path.join(self.collection_path, "ids.jsonl")
+        if not os.path.exists(rows_path):
+            return False
+        rows = np.fromfile(rows_path, dtype=np.int64, count=os.path.getsize(rows_path) // 8)
+        num_rows = len(rows) if num_rows is None else min(num_rows, len(rows))
+        ids, id_sizes = [], []
+        with open(ids_path, "rb") as f:
+            for line in f:
+                # An interrupted save may leave a partial last line
+                if len(ids) >= num_rows or not line.endswith(b"\n"):
+                    break
+                ids.append(json.loads(line))
+                id_sizes.append(len(line))
+        self.ids = ids
+        self.rows = rows[:len(ids)].tolist()
+        self.num_saved_ids = len(ids)
+        self.num_saved_id_bytes = sum(id_sizes)
+        self.corpus_changed = False
+        self._load_tombstones()
+        return True
+
+    def _read_legacy_corpus(self, num_rows: int = None) -> Tuple[List[str], List[str], List[Dict[str, Any]]]:
+        # Legacy format: the collection's own corpus.jsonl, moved into the passage store on the next save
+        ids, contents, metadatas = [], [], []
+        with open(os.path.join(self.collection_path, "corpus.jsonl"), "rb") as f:
+            for line in f:
+                if num_rows is not None and len(ids) >= num_rows:
+                    break
+                data = json.loads(line)
+                ids.append(data["id"])
+                contents.append(data["content"])
+                metadatas.append(data["metadata"])
+        return ids, contents, metadatas
+
+    def _set_passages(self, ids: List[str], contents: List[str], metadatas: List[Dict[str, Any]]):
+        self.ids = ids
+        self.rows = self.passage_store.add(contents, metadatas)
+        self.num_saved_ids = 0
+        self.corpus_changed = True
+        self._load_tombstones()
+
+    def _load_tombstones(self):
+        # Deleted rows are not indexed
+        self.tombstones = Tombstones.load(os.path.join(self.collection_path, "tombstones.npy"), len(self.ids))
+        deleted = self.tombstones.get_mask(len(self.ids))
+        self.indexing = {content_id: row for row, content_id in enumerate(self.ids) if not deleted[row]}
+
+
+class Database:
+    # Named collections (one directory each), loaded lazily and evicted least recently used past memory_budget bytes
+    def __init__(self, database_path: str, memory_budget: int = None, passage_store_path: str = None):
+        self.database_path = database_path
+        self.memory_budget = memory_budget
+        self.passage_store_path = passage_store_path if passage_store_path is not None else os.path.join(database_path, "passage_store")
+        self.passage_store = PassageStore.open(self.passage_store_path)
+
+        self.collections = OrderedDict()    # {name: collection}, least recently used first
+        self.collection_paths = {}          # {name: path}
+        self.memory_usages = {}             # {name: bytes}, measured when loaded and on save
+        self.evicted = weakref.WeakValueDictionary()    # {name: collection}, evicted but still referenced elsewhere
+        self.lock = threading.RLock()
+
+        if os.path.exists(self.database_path):
+            self.load()
+
+    def _create_collection(self, collection_path: str, **kwargs):
+        raise NotImplementedError
+
+    def get_collection_names(self) -> List[str]:
+        return list(self.collection_paths.keys())
+
+    def create_or_get_collection(self, name: str, **kwargs):
+        # Collection parameters (kwargs) only apply when the collection is created
+        with self.lock:
+            if name not in self.collection_paths:
+                self.collection_paths[name] = os.path.join(self.database_path, name)
+                return self._open_collection(name, **kwargs)
+            return self._open_collection(name)
+
+    def get_collection(self, name: str):
+        assert name in self.collection_paths, f"Collection not found: {name}"
+        with self.lock:
+            return self._open_collection(name)
+
+    def _open_collection(self, name: str, **kwargs):
+        if name in self.collections:
+            self.collections.move_to_end(name)
+            return self.collections[name]
+        # Reuse an evicted collection that is still held by a caller, so there is only ever one instance
+        collection = self.evicted.pop(name, None)
+        if collection is None:
+            collection = self._create_collection(self.collection_paths[name], **kwargs)
+        self.collections[name] = collection
+        self.memory_usages[name] = collection.memory_usage()
+        self._enforce_memory_budget()
+        return collection
+
+    def get_memory_usage(self) -> Dict[str, int]:
+        # Approximate resident bytes of each loaded collection
+        with self.lock:
+            self.memory_usages = {name: collection.memory_usage() for name, collection in self.collections.items()}
+            return dict(self.memory_usages)
+
+    def evict(self, name: str):
+        # Save the collection (if changed) and release it, it is reloaded on next use
+        with self.lock:
+            if name not in self.collections:
+                return
+            collection = self.collections.pop(name)
+            self.memory_usages.pop(name, None)
+            # Unchanged collections are released without writing (read-only processes share the files)
+            if collection.has_unsaved_changes():
+                self._save_collection_paths()
+                collection.save()
+            self.evicted[name] = collection
+
+    def _enforce_memory_budget(self):
+        if self.memory_budget is None:
+            return
+        # The most recently used collection is kept, even if it alone exceeds the budget
+        while len(self.collections) > 1 and sum(self.memory_usages.values()) > self.memory_budget:
+            self.evict(next(iter(self.collections)))
+
+    def _save_collection_paths(self):
+        # Create save_dir if not exists
+        if not os.path.exists(self.database_path):
+            os.makedirs(self.database_path)
+        save_json(self.collection_paths, os.path.join(self.database_path, "collection_paths.json"))
+
+    def save(self):
+        with self.lock:
+            # Create save_dir if not exists
+            if not os.path.exists(self.database_path):
+                os.makedirs(self.database_path)
+
+            if len(self.collection_paths) > 0:
+                # Save collection paths
+                self._save_collection_paths()
+                # Save collections
+                for name, collection in self.collections.items():
+                    collection.save()
+                    self.memory_usages[name] = collection.memory_usage()
+                # Evicted collections may have been written to through handles held by callers
+                for collection in list(self.evicted.values()):
+                    collection.save()
+                self._enforce_memory_budget()
+
+    def load(self):
+        # Check if index_dir exists
+        assert os.path.exists(self.database_path), f"Index directory not found: {self.database_path}"
+
+        if os.path.exists(os.path.join(self.database_path, "collection_paths.json")):
+            # Load collection paths (collections are loaded on first use)
+            self.collection_paths = json.load(open(os.path.join(self.database_path, "collection_paths.json"), "r"))
@@ -1,43 +1,64 @@
 import os
 import json
-import pickle
+import uuid
 import numpy as np
 from typing import List, Dict, Any
 from pythainlp.tokenize import word_tokenize
-from rank_bm25 import BM25Okapi, BM25Plus, BM25L, BM25
-from mkr.utilities.general_utils import normalize_score
+from mkr.databases.baseclass import Database, Collection, save_json
+from mkr.databases.passage_store import PassageStore
+from mkr.databases.token_cache import TokenCache
+from mkr.databases.bm25_engine import SegmentedBM25Engine, encode_tokenized_corpus
+from mkr.utilities.tokenization_utils import parallel_tokenize
+from mkr.utilities.general_utils import normalize_score, get_topk_indices
 
 
 class AutoBM25SeachEngine:
     @classmethod
-    def create_engine(cls, corpus: List[str], tokenizer_name: str = "newmm", engine_name: str = "bm25_okapi"):
-        # Tokenize corpus
-        tokenized_corpus = [word_tokenize(text, engine=tokenizer_name) for text in corpus]
+    def create_engine(
+            cls, 
+            corpus: List[str], 
+            tokenizer_name: str = "newmm", 
+            engine_name: str = "bm25_okapi", 
+            num_workers: int = 1, 
+            engine_params: Dict[str, float] = None,
+            token_cache: TokenCache = None,
+            corpus_name: str = None,
+        ):
+        # Tokenize corpus (reusing cached tokens if available)
+        if token_cache is not None:
+            token_ids, doc_offsets, vocab = token_cache.get_or_tokenize(corpus_name, corpus, tokenizer_name=tokenizer_name, num_workers=num_workers)
+        else:
+            tokenized_corpus = parallel_tokenize(corpus, tokenizer_name=tokenizer_name, num_workers=num_workers)
+            token_ids, doc_offsets, vocab = encode_tokenized_corpus(tokenized_corpus)
         # Create engine
-        if engine_name == "bm25_okapi":
-            engine = BM25Okapi(tokenized_corpus)
-        elif engine_name == "bm25_plus":
-            engine = BM25Plus(tokenized_corpus)
-        elif engine_name == "bm25_l":
-            engine = BM25L(tokenized_corpus)
-        elif engine_name == "bm25":
-            engine = BM25(tokenized_corpus)
+        if engine_name in ["bm25_okapi", "bm25_plus", "bm25_l"]:
+            engine = SegmentedBM25Engine.from_token_ids(token_ids, doc_offsets, vocab, variant=engine_name, **(engine_params or {}))
         else:
             raise ValueError(f"Unknown BM25 model: {engine_name}")
         return engine
 
 
-class BM25Collection:
-    def __init__(self, collection_path: str, tokenizer_name: str = "newmm", engine_name: str = "bm25_okapi",):
-        self.collection_path = collection_path
+class BM25Collection(Collection):
+    def __init__(
+            self, 
+            collection_path: str, 
+            tokenizer_name: str = "newmm", 
+            engine_name: str = "bm25_okapi", 
+            engine_params: Dict[str, float] = None, 
+            token_cache: TokenCache = None,
+            mmap: bool = True,
+            passage_store: PassageStore = None,
+        ):
+        super().__init__(collection_path, passage_store=passage_store)
+        # Memory-map the stored postings (read-only) instead of reading them into memory
+        self.mmap = mmap
         self.tokenizer_name = tokenizer_name
         self.engine_name = engine_name
+        self.engine_params = engine_params if engine_params is not None else {}
+        self.token_cache = token_cache
         # Initial parameters
-        self.ids = []
-        self.contents = []
-        self.metadatas = []
-        self.unique_ids = set()
         self.engine = None
+        self.engine_changed = False
         # Load parameters if exists
         if os.path.exists(self.collection_path):
             self.load()
@@ -48,38 +69,102 @@ class BM25Collection:
             contents: List[str], 
             metadatas: List[Dict[str, Any]],
         ):
-        # Add doc
-        for content_id, content, metadata in zip(ids, contents, metadatas):
-            if content_id in self.unique_ids:
-                continue
-            self.ids.append(content_id)
-            self.contents.append(content)
-            self.metadatas.append(metadata)
-            self.unique_ids.add(content_id)
+        # Add doc, new rows are indexed into a new segment by update_engine()
+        self._add_passages(ids, contents, metadatas)
+
+    def get_index_texts(self, start_index: int = 0) -> List[str]:
+        # Text indexed for each document (from start_index on): the title, if any, followed by the content
+        return [
+            f"{metadata['title']}\n{content}" if isinstance(metadata, dict) and "title" in metadata else content
+            for content, metadata in zip(self.contents[start_index:], self.metadatas[start_index:])
+        ]
+
+    def create_engine(self, num_workers: int = 1, engine_name: str = None, engine_params: Dict[str, float] = None):
+        # Switch BM25 variant or hyperparameters if given, cached tokens are reused
+        if engine_name is not None:
+            self.engine_name = engine_name
+        if engine_params is not None:
+            self.engine_params = engine_params
+        self.engine = AutoBM25SeachEngine.create_engine(
+            self.get_index_texts(), 
+            tokenizer_name=self.tokenizer_name, 
+            engine_name=self.engine_name, 
+            num_workers=num_workers,
+            engine_params=self.engine_params,
+            token_cache=self.token_cache,
+            corpus_name=os.path.basename(os.path.normpath(self.collection_path)),
+        )
+        self.engine_changed = True
+        self.version = uuid.uuid4().hex
+
+    def update_engine(self, num_workers: int = 1):
+        # Open the stored engine, or build it over all documents if there is none
+        if self.engine is None:
+            engine_path = os.path.join(self.collection_path, "engine")
+            if os.path.exists(os.path.join(engine_path, "segments.json")) or os.path.exists(os.path.join(engine_path, "engine.json")):
+                self.engine = SegmentedBM25Engine.load(engine_path, mmap=self.mmap)
+                self.engine_changed = False
+            else:
+                self.create_engine(num_workers=num_workers)
+        # Documents added since the engine was built go into a new segment
+        if self.engine.num_docs < len(self.contents):
+            tokenized_corpus = parallel_tokenize(self.get_index_texts(self.engine.num_docs), tokenizer_name=self.tokenizer_name, num_workers=num_workers)
+            self.engine.add_documents(*encode_tokenized_corpus(tokenized_corpus))
+            self.engine_changed = True
+            self.version = uuid.uuid4().hex
+
+    def compact(self):
+        # Reclaim deleted rows: remap the postings of every segment and drop the rows, remaining rows keep their order
+        if len(self.tombstones) == 0:
+            return
+        keep = ~self.tombstones.get_mask(len(self.ids))
+        self.get_engine().compact(keep)
+        self._compact_passages(np.flatnonzero(keep))
+        self.engine_changed = True
 
-    def create_engine(self):
-        self.engine = AutoBM25SeachEngine.create_engine(self.contents, self.tokenizer_name, self.engine_name)
+    def memory_usage(self) -> int:
+        # Approximate resident bytes of the rows and the opened engine (the shared passages are not counted)
+        nbytes = self._get_passages_memory_usage()
+        if self.engine is not None:
+            nbytes += self.engine.memory_usage()
+        return nbytes
 
     def search(
             self, 
             query: str, 
             top_k: int = 3, 
             candidate_ids: List[str] = None,
+            pruning: bool = False,
         ) -> List[Dict[str, Any]]:
         # Get search engine
-        if self.engine is None:
-            self.engine = AutoBM25SeachEngine.create_engine(self.contents, self.tokenizer_name, self.engine_name)
+        engine = self.get_engine()
         # Search
-        scores = self.engine.get_scores(word_tokenize(query, engine=self.tokenizer_name))
+        query_tokens = word_tokenize(query, engine=self.tokenizer_name)
         if candidate_ids is not None:
-            candidate_indices = [self.ids.index(candidate_id) for candidate_id in candidate_ids]
-            scores = scores[candidate_indices]
-        # Get top-k results
-        topk_indices = np.argsort(scores)[::-1][:top_k]
-        topk_scores = scores[topk_indices]
+            # Score only the candidate documents
+            candidate_indices = self.get_indices(candidate_ids)
+            scores = engine.get_batch_scores(query_tokens, candidate_indices)
+            topk_cand_indices = get_topk_indices(scores, top_k)
+            topk_scores = scores[topk_cand_indices]
+            topk_indices = candidate_indices[topk_cand_indices]
+        elif pruning:
+            # Dynamic pruning (MaxScore) avoids scoring and selecting over the whole corpus
+            # (over-fetch by the number of deleted rows, which are filtered below)
+            topk_scores, topk_indices = engine.search(query_tokens, top_k=top_k + len(self.tombstones), pruning=True)
+        else:
+            scores = engine.get_scores(query_tokens)
+            if len(self.tombstones) > 0:
+                scores[self.tombstones.get_mask(len(scores))] = -np.inf
+            topk_indices = get_topk_indices(scores, top_k)
+            topk_scores = scores[topk_indices]
 
         results = []
         for score, index in zip(topk_scores, topk_indices):
+            # Skip deleted rows
+            if self.tombstones.is_deleted(index):
+                continue
+            if len(results) >= top_k:
+                break
             results.append({
                 "id": self.ids[index],
                 "content": self.contents[index],
@@ -90,96 +175,90 @@ class BM25Collection:
         results = normalize_score(results)
         return results
     
+    def batch_search(
+            self, 
+            queries: List[str], 
+            top_k: int = 3, 
+            candidate_idss: List[List[str]] = None,
+            pruning: bool = False,
+        ) -> List[List[Dict[str, Any]]]:
+        if candidate_idss is None:
+            candidate_idss = [None] * len(queries)
+        return [self.search(query, top_k=top_k, candidate_ids=candidate_ids, pruning=pruning) for query, candidate_ids in zip(queries, candidate_idss)]
+
+    def has_unsaved_changes(self) -> bool:
+        return super().has_unsaved_changes() or (self.engine is not None and (self.engine_changed or self.engine.changed))
+
     def save(self):
         # Create save_dir if not exists
         if not os.path.exists(self.collection_path):
             os.makedirs(self.collection_path)
 
-        if len(self.unique_ids) > 0:
-            with open(os.path.join(self.collection_path, "corpus.jsonl"), "w", encoding="utf-8") as f:
-                for content_id, content, metadata in zip(self.ids, self.contents, self.metadatas):
-                    f.write(json.dumps({
-                        "id": content_id,
-                        "content": content,
-                        "metadata": metadata,
-                    }, ensure_ascii=False))
-                    f.write("\n")
-            # Save engine
-            pickle.dump(self.engine, open(os.path.join(self.collection_path, "engine.pkl"), "wb"))
+        if len(self.ids) > 0:
+            # Save rows (only when changed, a loaded collection is already on disk)
+            if self.corpus_changed:
+                self._save_passages()
+                self.corpus_changed = False
+            # Save engine (only when rebuilt or with unsaved segments, a loaded engine is already on disk),
+            # an in-flight background merge is finished first so its merged segment is saved too
+            if self.engine is not None:
+                self.engine.wait_for_merge()
+            if self.engine is not None and (self.engine_changed or self.engine.changed):
+                self._save_engine()
             # Save config
             config = {
                 "tokenizer_name": self.tokenizer_name,
                 "engine_name": self.engine_name,
+                "engine_params": self.engine_params,
+                "version": self.version,
             }
-            json.dump(config, open(os.path.join(self.collection_path, "config.json"), "w"))
+            save_json(config, os.path.join(self.collection_path, "config.json"))
         
+    def _save_engine(self):
+        # Only new segments are written, so readers that memory-mapped the saved ones are unaffected
+        self.engine.save(os.path.join(self.collection_path, "engine"))
+        self.engine_changed = False
+
+    def get_engine(self) -> SegmentedBM25Engine:
+        # Open the stored engine lazily on first use and index documents added since
+        self.update_engine()
+        return self.engine
+
     def load(self):
         # Check if index_dir exists
         assert os.path.exists(self.collection_path), f"Index directory not found: {self.collection_path}"
 
-        if os.path.exists(os.path.join(self.collection_path, "engine.pkl")):
-            self.ids = []
-            self.contents = []
-            self.metadatas = []
-            self.unique_ids = set()
-            with open(os.path.join(self.collection_path, "corpus.jsonl"), "rb") as f:
-                for line in f:
-                    data = json.loads(line)
-                    self.ids.append(data["id"])
-                    self.contents.append(data["content"])
-                    self.metadatas.append(data["metadata"])
-                    self.unique_ids.add(data["id"])
-            # Load engine
-            self.engine = pickle.load(open(os.path.join(self.collection_path, "engine.pkl"), "rb"))
+        if os.path.exists(os.path.join(self.collection_path, "config.json")):
+            if not self._load_passages():
+                # Legacy contents have the title prepended, the passage store keeps the content as is
+                ids, contents, metadatas = self._read_legacy_corpus()
+                contents = [
+                    content[len(metadata["title"]) + 1:]
+                    if isinstance(metadata, dict) and "title" in metadata and content.startswith(f"{metadata['title']}\n") else content
+                    for content, metadata in zip(contents, metadatas)
+                ]
+                self._set_passages(ids, contents, metadatas)
+            # Engine is opened lazily by get_engine() (legacy pickled engines are rebuilt)
+            self.engine = None
             # Load config
             config = json.load(open(os.path.join(self.collection_path, "config.json"), "r"))
             self.tokenizer_name = config["tokenizer_name"]
             self.engine_name = config["engine_name"]
+            self.engine_params = config.get("engine_params", {})
+            self.version = config.get("version", self.version)
 
 
-class BM25DB:
-    def __init__(self, database_path: str):
-        self.database_path = database_path
-
-        self.collections = {}       # {name: BM25Collection}
-        self.collection_paths = {}  # {name: path}
+class BM25DB(Database):
+    def __init__(self, database_path: str, token_cache_dir: str = None, memory_budget: int = None, passage_store_path: str = None):
+        # Tokenized corpora are cached per (corpus, tokenizer), shareable across databases
+        self.token_cache = TokenCache(token_cache_dir if token_cache_dir is not None else os.path.join(database_path, "token_cache"))
+        super().__init__(database_path, memory_budget=memory_budget, passage_store_path=passage_store_path)
 
-        if os.path.exists(self.database_path):
-            self.load()
-
-    def get_collection_names(self) -> List[str]:
-        return list(self.collection_paths.keys())
+    def _create_collection(self, collection_path: str) -> BM25Collection:
+        return BM25Collection(collection_path, token_cache=self.token_cache, passage_store=self.passage_store)
 
     def create_or_get_collection(self, name: str) -> BM25Collection:
-        if name not in self.collection_paths:
-            self.collection_paths[name] = os.path.join(self.database_path, name)
-            self.collections[name] = BM25Collection(self.collection_paths[name])
-        if name not in self.collections:
-            self.collections[name] = BM25Collection(self.collection_paths[name])
-        return self.collections[name]
-    
-    def get_collection(self, name: str) -> BM25Collection:
-        assert name in self.collection_paths, f"Collection not found: {name}"
-        if name not in self.collections:
-            self.collections[name] = BM25Collection(self.collection_paths[name])
-        return self.collections[name]
+        return super().create_or_get_collection(name)
 
-    def save(self):
-        # Create save_dir if not exists
-        if not os.path.exists(self.database_path):
-            os.makedirs(self.database_path)
-
-        if len(self.collection_paths) > 0:
-            # Save collection paths
-            json.dump(self.collection_paths, open(os.path.join(self.database_path, "collection_paths.json"), "w"))
-            # Save collections
-            for collection in self.collections.values():
-                collection.save()
-
-    def load(self):
-        # Check if index_dir exists
-        assert os.path.exists(self.database_path), f"Index directory not found: {self.database_path}"
-
-        if os.path.exists(os.path.join(self.database_path, "collection_paths.json")):
-            # Load collection paths
-            self.collection_paths = json.load(open(os.path.join(self.database_path, "collection_paths.json"), "r"))
\ No newline at end of file
+    def get_collection(self, name: str) -> BM25Collection:
+        return super().get_collection(name)
@@ -0,0 +1,517 @@
+import os
+import sys
+import json
+import uuid
+import shutil
+import threading
+import numpy as np
+from dataclasses import dataclass
+from collections import Counter
+from typing import List, Dict, Tuple
+from mkr.databases.baseclass import get_array_memory_usage
+from mkr.utilities.general_utils import get_topk_indices
+
+
+BM25_DEFAULT_PARAMS = {
+    "bm25_okapi": {"k1": 1.5, "b": 0.75, "epsilon": 0.25},
+    "bm25_plus": {"k1": 1.5, "b": 0.75, "delta": 1.0},
+    "bm25_l": {"k1": 1.5, "b": 0.75, "delta": 0.5},
+}
+
+
+def encode_tokenized_corpus(tokenized_corpus: List[List[str]]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    # Flat token ids (document i is token_ids[doc_offsets[i]:doc_offsets[i + 1]]) and the id-to-token vocab
+    vocab: Dict[str, int] = {}
+    token_ids = np.fromiter(
+        (vocab.setdefault(token, len(vocab)) for tokens in tokenized_corpus for token in tokens), 
+        dtype=np.int32,
+    )
+    doc_offsets = np.zeros(len(tokenized_corpus) + 1, dtype=np.int64)
+    np.cumsum([len(tokens) for tokens in tokenized_corpus], out=doc_offsets[1:])
+    return token_ids, doc_offsets, list(vocab)
+
+def build_postings(token_ids: np.ndarray, doc_offsets: np.ndarray, vocab_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # CSR postings: term t's sorted doc_ids and tfs are at indptr[t]:indptr[t + 1]
+    doc_lengths = np.diff(doc_offsets)
+    num_docs = len(doc_lengths)
+    token_ids = np.asarray(token_ids, dtype=np.int64)
+    token_doc_ids = np.repeat(np.arange(num_docs, dtype=np.int64), doc_lengths)
+    # Unique (term, doc) pairs sorted by term then doc, the counts are the term frequencies
+    keys, tfs = np.unique(token_ids * num_docs + token_doc_ids, return_counts=True)
+    term_ids = keys // num_docs if num_docs > 0 else keys
+    doc_ids = keys - term_ids * num_docs
+    indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_ids, minlength=vocab_size), out=indptr[1:])
+    return (
+        indptr,
+        doc_ids.astype(np.int32),
+        np.minimum(tfs, np.iinfo(np.uint16).max).astype(np.uint16),
+        doc_lengths.astype(np.float32),
+    )
+
+
+def compute_idf(doc_freqs: np.ndarray, num_docs: int, variant: str, params: Dict[str, float]) -> np.ndarray:
+    doc_freqs = doc_freqs.astype(np.float64)
+    if variant == "bm25_okapi":
+        idf = np.log(num_docs - doc_freqs + 0.5) - np.log(doc_freqs + 0.5)
+        # Negative idfs are floored to a fraction of the average idf
+        if len(idf) > 0:
+            idf[idf < 0] = params["epsilon"] * idf.mean()
+    elif variant == "bm25_l":
+        idf = np.log(num_docs + 1) - np.log(doc_freqs + 0.5)
+    else:
+        idf = np.log(num_docs + 1) - np.log(doc_freqs)
+    return idf.astype(np.float32)
+
+
+class BM25Engine:
+    # Inverted-index BM25 (Okapi, Plus and L variants, same formulas and defaults as rank_bm25)
+    def __init__(
+            self,
+            vocab: List[str],
+            indptr: np.ndarray,
+            doc_ids: np.ndarray,
+            tfs: np.ndarray,
+            doc_lengths: np.ndarray,
+            variant: str = "bm25_okapi",
+            max_tfs: np.ndarray = None,
+            min_doc_lengths: np.ndarray = None,
+            **params,
+        ):
+        if variant not in BM25_DEFAULT_PARAMS:
+            raise ValueError(f"Unknown BM25 model: {variant}")
+        self.variant = variant
+        self.params = {**BM25_DEFAULT_PARAMS[variant], **params}
+        # Postings (CSR)
+        self.vocab = {term: term_id for term_id, term in enumerate(vocab)}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        # Corpus statistics
+        self.num_docs = len(doc_lengths)
+        self.avgdl = float(np.mean(doc_lengths)) if self.num_docs > 0 else 0.0
+        self.idf = self._compute_idf(np.diff(indptr))
+        self.doc_norms = self._compute_doc_norms(doc_lengths)
+        # Per-term maximum tf and minimum doc length, bounding each term's contribution for dynamic pruning
+        if max_tfs is None or min_doc_lengths is None:
+            max_tfs, min_doc_lengths = self._compute_term_bounds()
+        self.max_tfs = max_tfs
+        self.min_doc_lengths = min_doc_lengths
+
+    @classmethod
+    def from_token_ids(
+            cls, 
+            token_ids: np.ndarray, 
+            doc_offsets: np.ndarray, 
+            vocab: List[str], 
+            variant: str = "bm25_okapi", 
+            **params,
+        ) -> "BM25Engine":
+        indptr, doc_ids, tfs, doc_lengths = build_postings(token_ids, doc_offsets, len(vocab))
+        return cls(vocab, indptr, doc_ids, tfs, doc_lengths, variant=variant, **params)
+
+    @classmethod
+    def from_tokenized_corpus(cls, tokenized_corpus: List[List[str]], variant: str = "bm25_okapi", **params) -> "BM25Engine":
+        token_ids, doc_offsets, vocab = encode_tokenized_corpus(tokenized_corpus)
+        return cls.from_token_ids(token_ids, doc_offsets, vocab, variant=variant, **params)
+
+    def compact(self, keep: np.ndarray) -> "BM25Engine":
+        # New engine without the documents where keep is False (renumbered in order, unused terms dropped)
+        new_doc_ids = np.cumsum(keep) - 1
+        term_ids = np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+        kept_postings = keep[self.doc_ids]
+        # Postings stay sorted by term then doc, as both remappings preserve order
+        used_term_ids, term_ids = np.unique(term_ids[kept_postings], return_inverse=True)
+        indptr = np.zeros(len(used_term_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(used_term_ids)), out=indptr[1:])
+        vocab = list(self.vocab)
+        return BM25Engine(
+            [vocab[term_id] for term_id in used_term_ids],
+            indptr,
+            new_doc_ids[self.doc_ids[kept_postings]].astype(np.int32),
+            np.asarray(self.tfs)[kept_postings],
+            np.asarray(self.doc_lengths)[keep],
+            variant=self.variant,
+            **self.params,
+        )
+
+    def save(self, engine_path: str):
+        # Columnar format: CSR postings and per-term/per-doc arrays as .npy files, plus vocab and config
+        if not os.path.exists(engine_path):
+            os.makedirs(engine_path)
+        np.save(os.path.join(engine_path, "indptr.npy"), np.asarray(self.indptr, dtype=np.int64))
+        np.save(os.path.join(engine_path, "doc_ids.npy"), np.asarray(self.doc_ids, dtype=np.int32))
+        np.save(os.path.join(engine_path, "tfs.npy"), np.asarray(self.tfs, dtype=np.uint16))
+        np.save(os.path.join(engine_path, "doc_lengths.npy"), np.asarray(self.doc_lengths, dtype=np.float32))
+        np.save(os.path.join(engine_path, "max_tfs.npy"), np.asarray(self.max_tfs, dtype=np.uint16))
+        np.save(os.path.join(engine_path, "min_doc_lengths.npy"), np.asarray(self.min_doc_lengths, dtype=np.float32))
+        json.dump(list(self.vocab), open(os.path.join(engine_path, "vocab.json"), "w", encoding="utf-8"), ensure_ascii=False)
+        config = {
+            "variant": self.variant,
+            "params": self.params,
+        }
+        json.dump(config, open(os.path.join(engine_path, "engine.json"), "w"))
+
+    @classmethod
+    def load(cls, engine_path: str, mmap: bool = True) -> "BM25Engine":
+        # Postings are memory-mapped read-only, so only the pages touched by queries are read
+        mmap_mode = "r" if mmap else None
+        config = json.load(open(os.path.join(engine_path, "engine.json"), "r"))
+        return cls(
+            vocab=json.load(open(os.path.join(engine_path, "vocab.json"), "r", encoding="utf-8")),
+            indptr=np.load(os.path.join(engine_path, "indptr.npy")),
+            doc_ids=np.load(os.path.join(engine_path, "doc_ids.npy"), mmap_mode=mmap_mode),
+            tfs=np.load(os.path.join(engine_path, "tfs.npy"), mmap_mode=mmap_mode),
+            doc_lengths=np.load(os.path.join(engine_path, "doc_lengths.npy")),
+            variant=config["variant"],
+            max_tfs=np.load(os.path.join(engine_path, "max_tfs.npy")),
+            min_doc_lengths=np.load(os.path.join(engine_path, "min_doc_lengths.npy")),
+            **config["params"],
+        )
+
+    def memory_usage(self) -> int:
+        # Approximate resident bytes (memory-mapped postings are not counted)
+        arrays = [self.indptr, self.doc_ids, self.tfs, self.doc_lengths, self.idf, self.doc_norms, self.max_tfs, self.min_doc_lengths]
+        return sum(get_array_memory_usage(array) for array in arrays) + \
+            sys.getsizeof(self.vocab) + sum(sys.getsizeof(term) for term in self.vocab)
+
+    def set_statistics(self, idf: np.ndarray, avgdl: float):
+        # Use corpus-level statistics (e.g. over all segments of a segmented index) instead of this engine's own
+        self.idf = idf
+        self.avgdl = avgdl
+        self.doc_norms = self._compute_doc_norms(self.doc_lengths)
+
+    def _compute_idf(self, doc_freqs: np.ndarray) -> np.ndarray:
+        return compute_idf(doc_freqs, self.num_docs, self.variant, self.params)
+
+    def _compute_doc_norms(self, doc_lengths: np.ndarray) -> np.ndarray:
+        b = self.params["b"]
+        avgdl = self.avgdl if self.avgdl > 0 else 1.0
+        return (1 - b + b * doc_lengths / avgdl).astype(np.float32)
+
+    def _compute_term_bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        max_tfs = np.zeros(len(self.indptr) - 1, dtype=np.uint16)
+        min_doc_lengths = np.zeros(len(self.indptr) - 1, dtype=np.float32)
+        nonempty = np.flatnonzero(np.diff(self.indptr) > 0)
+        if len(nonempty) > 0:
+            starts = self.indptr[:-1][nonempty]
+            max_tfs[nonempty] = np.maximum.reduceat(self.tfs, starts)
+            min_doc_lengths[nonempty] = np.minimum.reduceat(self.doc_lengths[self.doc_ids], starts)
+        return max_tfs, min_doc_lengths
+
+    def _term_scores(self, tfs: np.ndarray, doc_norms: np.ndarray) -> np.ndarray:
+        # Per-posting term weight (without idf); documents without the term contribute 0.
+        # For BM25+ this drops the per-term constant (idf * delta) that rank_bm25 adds to every document,
+        # which changes neither the ranking nor the normalized scores.
+        k1 = self.params["k1"]
+        tfs = tfs.astype(np.float32)
+        if self.variant == "bm25_okapi":
+            return tfs * (k1 + 1) / (tfs + k1 * doc_norms)
+        elif self.variant == "bm25_l":
+            ctd = tfs / doc_norms
+            delta = self.params["delta"]
+            return tfs * (k1 + 1) * (ctd + delta) / (k1 + ctd + delta)
+        else:
+            return tfs * (k1 + 1) / (k1 * doc_norms + tfs)
+
+    def _get_query_terms(self, query_tokens: List[str]) -> List[Tuple[int, int]]:
+        # [(term_id, query_term_frequency)], out-of-vocabulary tokens are skipped
+        return [(self.vocab[token], count) for token, count in Counter(query_tokens).items() if token in self.vocab]
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term_id, query_tf in self._get_query_terms(query_tokens):
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            scores[doc_ids] += query_tf * self.idf[term_id] * self._term_scores(self.tfs[start:end], self.doc_norms[doc_ids])
+        return scores
+
+    def get_batch_scores(self, query_tokens: List[str], doc_indices: np.ndarray) -> np.ndarray:
+        # Score only the given documents by looking them up in each (sorted) postings list
+        doc_indices = np.asarray(doc_indices, dtype=np.int64)
+        scores = np.zeros(len(doc_indices), dtype=np.float32)
+        for term_id, query_tf in self._get_query_terms(query_tokens):
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            positions = np.minimum(np.searchsorted(doc_ids, doc_indices), len(doc_ids) - 1)
+            matched = doc_ids[positions] == doc_indices
+            tfs = self.tfs[start:end][positions[matched]]
+            scores[matched] += query_tf * self.idf[term_id] * self._term_scores(tfs, self.doc_norms[doc_indices[matched]])
+        return scores
+
+    def _get_upper_bound(self, term_id: int, query_tf: int) -> float:
+        # Term scores grow with tf and shrink with the doc length, so (max tf, min length) bounds every posting
+        min_doc_norms = self._compute_doc_norms(self.min_doc_lengths[term_id:term_id + 1])
+        term_score = self._term_scores(self.max_tfs[term_id:term_id + 1], min_doc_norms)[0]
+        return float(query_tf * self.idf[term_id] * term_score)
+
+    def search(self, query_tokens: List[str], top_k: int = 3, pruning: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        # Top-k (scores, doc_indices); pruning=True uses MaxScore and only returns documents matching a query term
+        query_terms = self._get_query_terms(query_tokens)
+        # Pruning is only safe when every term contributes non-negatively
+        if pruning and all(self.idf[term_id] >= 0 for term_id, _ in query_terms):
+            return self._search_maxscore(query_terms, top_k)
+        scores = self.get_scores(query_tokens)
+        topk_indices = get_topk_indices(scores, top_k)
+        return scores[topk_indices], topk_indices
+
+    def _search_maxscore(self, query_terms: List[Tuple[int, int]], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Process terms by decreasing upper bound; remaining_bounds[i] bounds what terms i.. can still add
+        upper_bounds = np.array([self._get_upper_bound(term_id, query_tf) for term_id, query_tf in query_terms], dtype=np.float64)
+        order = np.argsort(-upper_bounds, kind="stable")
+        remaining_bounds = np.cumsum(upper_bounds[order][::-1])[::-1]
+
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        candidates = np.zeros(0, dtype=np.int64)
+        threshold = -np.inf     # Lower bound of the final k-th best score
+        for step, term_index in enumerate(order):
+            term_id, query_tf = query_terms[term_index]
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            if len(candidates) >= top_k and remaining_bounds[step] <= threshold:
+                # Non-essential term: unseen documents can no longer reach the top-k,
+                # so drop hopeless candidates and only update the surviving ones
+                candidates = candidates[scores[candidates] + remaining_bounds[step] >= threshold]
+                positions = np.minimum(np.searchsorted(doc_ids, candidates), len(doc_ids) - 1)
+                matched = doc_ids[positions] == candidates
+                matched_doc_ids = candidates[matched]
+                tfs = self.tfs[start:end][positions[matched]]
+                scores[matched_doc_ids] += query_tf * self.idf[term_id] * self._term_scores(tfs, self.doc_norms[matched_doc_ids])
+            else:
+                # Essential term: score its whole postings list
+                scores[doc_ids] += query_tf * self.idf[term_id] * self._term_scores(self.tfs[start:end], self.doc_norms[doc_ids])
+                candidates = np.union1d(candidates, doc_ids)
+            if len(candidates) >= top_k:
+                threshold = max(threshold, float(np.partition(scores[candidates], len(candidates) - top_k)[len(candidates) - top_k]))
+
+        candidate_scores = scores[candidates]
+        topk_indices = get_topk_indices(candidate_scores, top_k)
+        return candidate_scores[topk_indices], candidates[topk_indices]
+
+
+
+@dataclass
+class BM25Segment:
+    engine: BM25Engine
+    term_ids: np.ndarray        # Local term id -> global term id
+    doc_base: int = 0           # Global row of the segment's first document
+    name: str = None            # Directory name once saved (saved segments are immutable)
+
+
+class SegmentedBM25Engine:
+    # BM25 over immutable segments sharing corpus-level statistics, merged in the background past max_segments
+    def __init__(self, variant: str = "bm25_okapi", max_segments: int = 8, **params):
+        if variant not in BM25_DEFAULT_PARAMS:
+            raise ValueError(f"Unknown BM25 model: {variant}")
+        self.variant = variant
+        self.params = {**BM25_DEFAULT_PARAMS[variant], **params}
+        self.max_segments = max_segments
+        self.segments: List[BM25Segment] = []
+        # Corpus statistics
+        self.vocab: Dict[str, int] = {}     # {term: global term id}
+        self.doc_freqs = np.zeros(0, dtype=np.int64)
+        self.num_docs = 0
+        self.total_length = 0.0
+        self.statistics_changed = False
+        self.lock = threading.RLock()
+        self.merge_thread = None
+
+    @classmethod
+    def from_token_ids(
+            cls, 
+            token_ids: np.ndarray, 
+            doc_offsets: np.ndarray, 
+            vocab: List[str], 
+            variant: str = "bm25_okapi", 
+            max_segments: int = 8,
+            **params,
+        ) -> "SegmentedBM25Engine":
+        engine = cls(variant=variant, max_segments=max_segments, **params)
+        engine.add_documents(token_ids, doc_offsets, vocab)
+        return engine
+
+    def _create_segment(self, engine: BM25Engine, name: str = None) -> BM25Segment:
+        # Map the segment's terms to global term ids (new terms extend the global vocab)
+        term_ids = np.fromiter((self.vocab.setdefault(term, len(self.vocab)) for term in engine.vocab), dtype=np.int64, count=len(engine.vocab))
+        if len(self.vocab) > len(self.doc_freqs):
+            self.doc_freqs = np.concatenate([self.doc_freqs, np.zeros(len(self.vocab) - len(self.doc_freqs), dtype=np.int64)])
+        # Update corpus statistics
+        np.add.at(self.doc_freqs, term_ids, np.diff(engine.indptr))
+        self.num_docs += engine.num_docs
+        self.total_length += float(np.sum(engine.doc_lengths, dtype=np.float64))
+        self.statistics_changed = True
+        return BM25Segment(engine=engine, term_ids=term_ids, name=name)
+
+    def add_documents(self, token_ids: np.ndarray, doc_offsets: np.ndarray, vocab: List[str]):
+        if len(doc_offsets) <= 1:
+            return
+        engine = BM25Engine.from_token_ids(token_ids, doc_offsets, vocab, variant=self.variant, **self.params)
+        with self.lock:
+            self.segments.append(self._create_segment(engine))
+        if len(self.segments) > self.max_segments:
+            self.merge(background=True)
+
+    def _get_segments(self) -> List[BM25Segment]:
+        # Push the corpus statistics to the segments if they changed
+        with self.lock:
+            if self.statistics_changed:
+                idf = compute_idf(self.doc_freqs, self.num_docs, self.variant, self.params)
+                avgdl = self.total_length / self.num_docs if self.num_docs > 0 else 0.0
+                doc_base = 0
+                for segment in self.segments:
+                    segment.doc_base = doc_base
+                    segment.engine.set_statistics(idf[segment.term_ids], avgdl)
+                    doc_base += segment.engine.num_docs
+                self.statistics_changed = False
+            return list(self.segments)
+
+    def get_scores(self, query_tokens: List[str]) -> np.ndarray:
+        segments = self._get_segments()
+        if len(segments) == 0:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate([segment.engine.get_scores(query_tokens) for segment in segments])
+
+    def get_batch_scores(self, query_tokens: List[str], doc_indices: np.ndarray) -> np.ndarray:
+        doc_indices = np.asarray(doc_indices, dtype=np.int64)
+        scores = np.zeros(len(doc_indices), dtype=np.float32)
+        for segment in self._get_segments():
+            in_segment = (doc_indices >= segment.doc_base) & (doc_indices < segment.doc_base + segment.engine.num_docs)
+            if np.any(in_segment):
+                scores[in_segment] = segment.engine.get_batch_scores(query_tokens, doc_indices[in_segment] - segment.doc_base)
+        return scores
+
+    def search(self, query_tokens: List[str], top_k: int = 3, pruning: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        # Top-k of each segment (pruned with the segment's own term bounds), then the global top-k
+        lst_scores, lst_indices = [], []
+        for segment in self._get_segments():
+            scores, doc_indices = segment.engine.search(query_tokens, top_k=top_k, pruning=pruning)
+            lst_scores.append(scores)
+            lst_indices.append(np.asarray(doc_indices, dtype=np.int64) + segment.doc_base)
+        if len(lst_scores) == 0:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        scores = np.concatenate(lst_scores)
+        doc_indices = np.concatenate(lst_indices)
+        topk_indices = get_topk_indices(scores, top_k)
+        return scores[topk_indices], doc_indices[topk_indices]
+
+    def merge(self, background: bool = False):
+        if not background:
+            self._merge()
+            return
+        # At most one background merge at a time
+        with self.lock:
+            if self.merge_thread is not None and self.merge_thread.is_alive():
+                return
+            self.merge_thread = threading.Thread(target=self._merge, daemon=True)
+            self.merge_thread.start()
+
+    def wait_for_merge(self):
+        if self.merge_thread is not None:
+            self.merge_thread.join()
+
+    @property
+    def changed(self) -> bool:
+        # Segments not yet written (new or merged, e.g. by a background merge that finished after the last save)
+        with self.lock:
+            return any(segment.name is None for segment in self.segments)
+
+    def _merge(self):
+        # Merge the current segments into one, segments added meanwhile are kept after it
+        with self.lock:
+            segments = list(self.segments)
+            vocab = list(self.vocab)
+        if len(segments) <= 1:
+            return
+        term_ids, doc_ids, tfs, doc_lengths = [], [], [], []
+        doc_base = 0
+        for segment in segments:
+            engine = segment.engine
+            # Postings are sorted by term then doc, so a stable sort on the global term id keeps docs sorted
+            term_ids.append(segment.term_ids[np.repeat(np.arange(len(engine.indptr) - 1), np.diff(engine.indptr))])
+            doc_ids.append(np.asarray(engine.doc_ids, dtype=np.int64) + doc_base)
+            tfs.append(np.asarray(engine.tfs))
+            doc_lengths.append(np.asarray(engine.doc_lengths))
+            doc_base += engine.num_docs
+        term_ids = np.concatenate(term_ids)
+        order = np.argsort(term_ids, kind="stable")
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=indptr[1:])
+        merged_engine = BM25Engine(
+            vocab,
+            indptr,
+            np.concatenate(doc_ids)[order].astype(np.int32),
+            np.concatenate(tfs)[order],
+            np.concatenate(doc_lengths),
+            variant=self.variant,
+            **self.params,
+        )
+        merged_segment = BM25Segment(engine=merged_engine, term_ids=np.arange(len(vocab), dtype=np.int64))
+        with self.lock:
+            assert all(a is b for a, b in zip(self.segments, segments)), "Segments changed during merge"
+            self.segments = [merged_segment] + self.segments[len(segments):]
+            self.statistics_changed = True
+
+    def memory_usage(self) -> int:
+        # Approximate resident bytes of the segments and the corpus statistics
+        with self.lock:
+            nbytes = sum(segment.engine.memory_usage() + segment.term_ids.nbytes for segment in self.segments)
+            return nbytes + self.doc_freqs.nbytes + sys.getsizeof(self.vocab) + sum(sys.getsizeof(term) for term in self.vocab)
+
+    def compact(self, keep: np.ndarray):
+        # Drop the documents where keep is False from every segment and recompute the corpus statistics
+        self.wait_for_merge()
+        with self.lock:
+            segments = self._get_segments()
+            self.segments = []
+            self.vocab = {}
+            self.doc_freqs = np.zeros(0, dtype=np.int64)
+            self.num_docs = 0
+            self.total_length = 0.0
+            for segment in segments:
+                segment_keep = keep[segment.doc_base:segment.doc_base + segment.engine.num_docs]
+                if np.all(segment_keep):
+                    self.segments.append(self._create_segment(segment.engine, name=segment.name))
+                elif np.any(segment_keep):
+                    self.segments.append(self._create_segment(segment.engine.compact(segment_keep)))
+            self.statistics_changed = True
+
+    def save(self, engine_path: str):
+        # Only new segments are written, saved segments are immutable and shared with readers
+        if not os.path.exists(engine_path):
+            os.makedirs(engine_path)
+        with self.lock:
+            segments = list(self.segments)
+            for segment in segments:
+                if segment.name is None:
+                    segment.name = f"segment_{uuid.uuid4().hex[:12]}"
+                    segment_path = os.path.join(engine_path, segment.name)
+                    segment.engine.save(segment_path + ".tmp")
+                    os.rename(segment_path + ".tmp", segment_path)
+        config = {
+            "variant": self.variant,
+            "params": self.params,
+            "max_segments": self.max_segments,
+            "segments": [segment.name for segment in segments],
+        }
+        json.dump(config, open(os.path.join(engine_path, "segments.json.tmp"), "w"))
+        os.replace(os.path.join(engine_path, "segments.json.tmp"), os.path.join(engine_path, "segments.json"))
+        # Remove merged-away segments (readers that memory-mapped them keep their open files)
+        for name in os.listdir(engine_path):
+            if name.startswith("segment_") and name not in config["segments"]:
+                shutil.rmtree(os.path.join(engine_path, name))
+
+    @classmethod
+    def load(cls, engine_path: str, mmap: bool = True) -> "SegmentedBM25Engine":
+        if not os.path.exists(os.path.join(engine_path, "segments.json")):
+            # Single (unsegmented) engine
+            engine = BM25Engine.load(engine_path, mmap=mmap)
+            segmented_engine = cls(variant=engine.variant, **engine.params)
+            segmented_engine.segments.append(segmented_engine._create_segment(engine))
+            return segmented_engine
+        config = json.load(open(os.path.join(engine_path, "segments.json"), "r"))
+        segmented_engine = cls(variant=config["variant"], max_segments=config["max_segments"], **config["params"])
+        for name in config["segments"]:
+            engine = BM25Engine.load(os.path.join(engine_path, name), mmap=mmap)
+            segmented_engine.segments.append(segmented_engine._create_segment(engine, name=name))
+        return segmented_engine
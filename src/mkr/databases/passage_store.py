@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import weakref
+import threading
+from hashlib import sha256
+from collections.abc import Sequence
+from typing import List, Dict, Any
+
+
+def get_content_hash(content: str) -> str:
+    # Same as the "hash" field written by the corpus scripts
+    return sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_ids_memory_usage(ids: List[str]) -> int:
+    return sys.getsizeof(ids) + sum(sys.getsizeof(content_id) for content_id in ids)
+
+
+def get_corpus_memory_usage(ids: List[str], contents: List[str], metadatas: List[Dict[str, Any]], indexing: Dict[str, int]) -> int:
+    # Approximate size of the in-memory documents (metadata dicts are measured one level deep)
+    nbytes = sys.getsizeof(ids) + sys.getsizeof(contents) + sys.getsizeof(metadatas) + sys.getsizeof(indexing)
+    for content_id, content, metadata in zip(ids, contents, metadatas):
+        nbytes += sys.getsizeof(content_id) + sys.getsizeof(content) + sys.getsizeof(metadata)
+        if isinstance(metadata, dict):
+            nbytes += sum(sys.getsizeof(value) for value in metadata.values())
+    return nbytes
+
+
+class PassageView(Sequence):
+    # Read-only view of one field of the passage store, in the row order of a collection
+    def __init__(self, values: List[Any], rows: List[int]):
+        self.values = values
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.values[row] for row in self.rows[index]]
+        return self.values[self.rows[index]]
+
+
+class PassageStore:
+    # Append-only passages keyed by content hash, shared by all collections opened on the same store_path
+    stores = weakref.WeakValueDictionary()    # {store_path: PassageStore}, one instance per path within the process
+    stores_lock = threading.Lock()
+
+    def __init__(self, store_path: str):
+        self.store_path = store_path
+        # Initial parameters
+        self._hashes = []
+        self._contents = []
+        self._metadatas = []
+        self._indexing = {}         # {hash: row}
+        self.variant_rows = {}      # {hash: [row]}, further rows of the same content with other metadata
+        self.num_saved_rows = 0     # Rows already written to disk, later rows are appended on save
+        self.num_saved_bytes = 0    # Size of the saved rows, anything after it is a partial append (repaired on save)
+        self.metadata_changed = False
+        self.loaded = False
+        self.lock = threading.RLock()
+
+    @classmethod
+    def open(cls, store_path: str) -> "PassageStore":
+        # Databases opened on the same store_path share one in-memory copy of the passages
+        key = os.path.abspath(store_path)
+        with cls.stores_lock:
+            store = cls.stores.get(key)
+            if store is None:
+                store = cls.stores[key] = cls(store_path)
+            return store
+
+    def _ensure_loaded(self):
+        with self.lock:
+            if not self.loaded:
+                if os.path.exists(self.store_path):
+                    self.load()
+                self.loaded = True
+
+    @property
+    def hashes(self) -> List[str]:
+        self._ensure_loaded()
+        return self._hashes
+
+    @property
+    def contents(self) -> List[str]:
+        self._ensure_loaded()
+        return self._contents
+
+    @property
+    def metadatas(self) -> List[Dict[str, Any]]:
+        self._ensure_loaded()
+        return self._metadatas
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def add(
+            self,
+            contents: List[str],
+            metadatas: List[Dict[str, Any]],
+        ) -> List[int]:
+        # Returns the row of each passage, passages already in the store are not added again
+        self._ensure_loaded()
+        rows = []
+        with self.lock:
+            for content, metadata in zip(contents, metadatas):
+                content_hash = get_content_hash(content)
+                row = self._indexing.get(content_hash)
+                if row is None:
+                    row = self._indexing[content_hash] = self._append(content_hash, content, metadata)
+                elif self._metadatas[row] is None and metadata is not None:
+                    # Metadata missing in the store (e.g. added by the dense retriever) is filled in by later adds
+                    self._metadatas[row] = metadata
+                    self.metadata_changed = True
+                elif metadata is not None and metadata != self._metadatas[row]:
+                    # Same content with other metadata (e.g. another title) gets its own row
+                    variant_rows = self.variant_rows.setdefault(content_hash, [])
+                    row = next((variant_row for variant_row in variant_rows if self._metadatas[variant_row] == metadata), None)
+                    if row is None:
+                        row = self._append(content_hash, content, metadata)
+                        variant_rows.append(row)
+                rows.append(row)
+        return rows
+
+    def _append(self, content_hash: str, content: str, metadata: Dict[str, Any]) -> int:
+        self._hashes.append(content_hash)
+        self._contents.append(content)
+        self._metadatas.append(metadata)
+        return len(self._hashes) - 1
+
+    def memory_usage(self) -> int:
+        # Approximate resident bytes of the passages (nothing until they are first used)
+        with self.lock:
+            if not self.loaded:
+                return 0
+            return get_corpus_memory_usage(self._hashes, self._contents, self._metadatas, self._indexing)
+
+    def save(self):
+        with self.lock:
+            if not self.loaded or (self.num_saved_rows == len(self._hashes) and not self.metadata_changed):
+                return
+            # Create save_dir if not exists
+            if not os.path.exists(self.store_path):
+                os.makedirs(self.store_path)
+            passages_path = os.path.join(self.store_path, "passages.jsonl")
+            if self.num_saved_rows > 0 and not self.metadata_changed and \
+                    os.path.exists(passages_path) and os.path.getsize(passages_path) >= self.num_saved_bytes:
+                # Append only the new passages, after dropping a partial line left by an interrupted append
+                with open(passages_path, "r+b") as f:
+                    f.truncate(self.num_saved_bytes)
+                    f.seek(self.num_saved_bytes)
+                    self.num_saved_bytes += self._write_passages(f, self.num_saved_rows)
+            else:
+                with open(passages_path + ".tmp", "wb") as f:
+                    self.num_saved_bytes = self._write_passages(f, 0)
+                os.replace(passages_path + ".tmp", passages_path)
+            self.num_saved_rows = len(self._hashes)
+            self.metadata_changed = False
+
+    def _write_passages(self, f, start_index: int) -> int:
+        # Returns the number of bytes written
+        nbytes = 0
+        for content_hash, content, metadata in zip(self._hashes[start_index:], self._contents[start_index:], self._metadatas[start_index:]):
+            line = json.dumps({
+                "hash": content_hash,
+                "content": content,
+                "metadata": metadata,
+            }, ensure_ascii=False).encode("utf-8") + b"\n"
+            f.write(line)
+            nbytes += len(line)
+        return nbytes
+
+    def load(self):
+        # Check if store_path exists
+        assert os.path.exists(self.store_path), f"Passage store not found: {self.store_path}"
+
+        passages_path = os.path.join(self.store_path, "passages.jsonl")
+        if os.path.exists(passages_path):
+            self._hashes = []
+            self._contents = []
+            self._metadatas = []
+            self._indexing = {}
+            self.variant_rows = {}
+            self.num_saved_bytes = 0
+            with open(passages_path, "rb") as f:
+                for line in f:
+                    # An interrupted append may leave a partial last line, it is ignored here and overwritten
+                    # by the writer's next save
+                    if not line.endswith(b"\n"):
+                        break
+                    self.num_saved_bytes += len(line)
+                    data = json.loads(line)
+                    content_hash = data["hash"] if "hash" in data else get_content_hash(data["content"])
+                    row = self._append(content_hash, data["content"], data["metadata"])
+                    if content_hash in self._indexing:
+                        self.variant_rows.setdefault(content_hash, []).append(row)
+                    else:
+                        self._indexing[content_hash] = row
+            self.num_saved_rows = len(self._hashes)
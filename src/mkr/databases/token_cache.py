@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+import numpy as np
+from typing import List, Tuple
+from mkr.databases.bm25_engine import encode_tokenized_corpus
+from mkr.utilities.tokenization_utils import parallel_tokenize
+
+
+class TokenCache:
+    # Tokenized corpora per (corpus, tokenizer), so rebuilding a BM25 engine skips tokenization
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def get_corpus_checksum(corpus: List[str]) -> str:
+        checksum = hashlib.sha256()
+        for text in corpus:
+            checksum.update(text.encode("utf-8"))
+            checksum.update(b"\0")
+        return checksum.hexdigest()
+
+    def _get_entry_path(self, corpus_name: str, tokenizer_name: str) -> str:
+        return os.path.join(self.cache_dir, corpus_name, tokenizer_name)
+
+    def load(self, corpus_name: str, tokenizer_name: str, corpus_checksum: str) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        entry_path = self._get_entry_path(corpus_name, tokenizer_name)
+        if not os.path.exists(os.path.join(entry_path, "cache.json")):
+            return None
+        # Stale if the corpus has changed since it was tokenized
+        cache_config = json.load(open(os.path.join(entry_path, "cache.json"), "r"))
+        if cache_config["corpus_checksum"] != corpus_checksum:
+            return None
+        token_ids = np.load(os.path.join(entry_path, "token_ids.npy"), mmap_mode="r")
+        doc_offsets = np.load(os.path.join(entry_path, "doc_offsets.npy"))
+        vocab = json.load(open(os.path.join(entry_path, "vocab.json"), "r", encoding="utf-8"))
+        return token_ids, doc_offsets, vocab
+
+    def save(
+            self, 
+            corpus_name: str, 
+            tokenizer_name: str, 
+            corpus_checksum: str, 
+            token_ids: np.ndarray, 
+            doc_offsets: np.ndarray, 
+            vocab: List[str],
+        ):
+        entry_path = self._get_entry_path(corpus_name, tokenizer_name)
+        # Create entry_path if not exists
+        if not os.path.exists(entry_path):
+            os.makedirs(entry_path)
+        # Invalidate the previous entry first, so its checksum never describes the new arrays
+        if os.path.exists(os.path.join(entry_path, "cache.json")):
+            os.remove(os.path.join(entry_path, "cache.json"))
+        # Each file is swapped in whole, readers that memory-mapped the old arrays are unaffected
+        with open(os.path.join(entry_path, "token_ids.npy.tmp"), "wb") as f:
+            np.save(f, np.asarray(token_ids, dtype=np.int32))
+        os.replace(os.path.join(entry_path, "token_ids.npy.tmp"), os.path.join(entry_path, "token_ids.npy"))
+        with open(os.path.join(entry_path, "doc_offsets.npy.tmp"), "wb") as f:
+            np.save(f, np.asarray(doc_offsets, dtype=np.int64))
+        os.replace(os.path.join(entry_path, "doc_offsets.npy.tmp"), os.path.join(entry_path, "doc_offsets.npy"))
+        with open(os.path.join(entry_path, "vocab.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(vocab, f, ensure_ascii=False)
+        os.replace(os.path.join(entry_path, "vocab.json.tmp"), os.path.join(entry_path, "vocab.json"))
+        # Written last, so an interrupted save is never mistaken for a valid entry
+        with open(os.path.join(entry_path, "cache.json.tmp"), "w") as f:
+            json.dump({"corpus_checksum": corpus_checksum}, f)
+        os.replace(os.path.join(entry_path, "cache.json.tmp"), os.path.join(entry_path, "cache.json"))
+
+    def get_or_tokenize(
+            self, 
+            corpus_name: str, 
+            corpus: List[str], 
+            tokenizer_name: str = "newmm", 
+            num_workers: int = 1,
+        ) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        corpus_checksum = self.get_corpus_checksum(corpus)
+        cached_tokens = self.load(corpus_name, tokenizer_name, corpus_checksum)
+        if cached_tokens is not None:
+            return cached_tokens
+        # Tokenize and cache
+        tokenized_corpus = parallel_tokenize(corpus, tokenizer_name=tokenizer_name, num_workers=num_workers)
+        token_ids, doc_offsets, vocab = encode_tokenized_corpus(tokenized_corpus)
+        self.save(corpus_name, tokenizer_name, corpus_checksum, token_ids, doc_offsets, vocab)
+        return token_ids, doc_offsets, vocab
@@ -0,0 +1,52 @@
+import os
+import numpy as np
+from typing import Iterable
+
+
+class Tombstones:
+    # Bitmap of deleted rows, skipped at search time until compaction (saved packed, one bit per row)
+    def __init__(self):
+        self.mask = np.zeros(0, dtype=bool)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def delete(self, rows: Iterable[int]):
+        rows = np.fromiter(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        if rows.max() >= len(self.mask):
+            self.mask = np.concatenate([self.mask, np.zeros(rows.max() + 1 - len(self.mask), dtype=bool)])
+        self.mask[rows] = True
+        self.count = int(self.mask.sum())
+
+    def is_deleted(self, row: int) -> bool:
+        return row < len(self.mask) and bool(self.mask[row])
+
+    def get_mask(self, num_rows: int) -> np.ndarray:
+        # Boolean mask over all rows (rows added after the last deletion are not deleted)
+        if len(self.mask) >= num_rows:
+            return self.mask[:num_rows]
+        return np.concatenate([self.mask, np.zeros(num_rows - len(self.mask), dtype=bool)])
+
+    def clear(self):
+        self.mask = np.zeros(0, dtype=bool)
+        self.count = 0
+
+    def save(self, tombstones_path: str):
+        if self.count == 0:
+            if os.path.exists(tombstones_path):
+                os.remove(tombstones_path)
+            return
+        with open(tombstones_path + ".tmp", "wb") as f:
+            np.save(f, np.packbits(self.mask))
+        os.replace(tombstones_path + ".tmp", tombstones_path)
+
+    @classmethod
+    def load(cls, tombstones_path: str, num_rows: int) -> "Tombstones":
+        tombstones = cls()
+        if os.path.exists(tombstones_path):
+            tombstones.mask = np.unpackbits(np.load(tombstones_path), count=num_rows).astype(bool)
+            tombstones.count = int(tombstones.mask.sum())
+        return tombstones
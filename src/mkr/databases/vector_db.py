@@ -2,19 +2,48 @@ import os
 import json
 import faiss
 import pickle
+import hashlib
 import numpy as np
 from typing import List, Dict, Any
-from mkr.utilities.general_utils import normalize_score
+from mkr.databases.baseclass import Database, Collection, get_array_memory_usage, save_json
+from mkr.databases.passage_store import PassageStore
+from mkr.utilities.general_utils import normalize_score, file_checksum, get_topk_indices
+
+
+class FlatSearchEngine:
+    # Exhaustive inner-product search directly over a float32 matrix, the matrix is not copied into an index
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+        self.ntotal = embeddings.shape[0]
+
+    def search(self, query_vectors: np.ndarray, k: int):
+        return faiss.knn(query_vectors, self.embeddings, k, metric=faiss.METRIC_INNER_PRODUCT)
+
+
+def get_index_memory_usage(index) -> int:
+    # Approximate size of the codes of a FAISS index (indexes without a standalone code size are counted as float32)
+    try:
+        return index.sa_code_size() * index.ntotal
+    except RuntimeError:
+        return index.d * 4 * index.ntotal
 
 
 class AutoVectorSeachEngine:
+    # Collections smaller than this are searched exhaustively when no factory string is given
+    max_flat_size = 1000000
+
     @classmethod
-    def create_engine(cls, embeddings: np.ndarray, engine_name: str = "faiss"):
+    def create_engine(cls, embeddings: np.ndarray, engine_name: str = "faiss", index_factory: str = None):
         if engine_name == "faiss":
-            if embeddings.shape[0] < 1000000:
-                # Using flat index on small dataset
-                engine = faiss.IndexFlatIP(embeddings.shape[-1])
+            if index_factory is not None:
+                # Using FAISS factory string, e.g. "HNSW32", "IVF4096,PQ64", "OPQ32,IVF1024,PQ32"
+                engine = faiss.index_factory(embeddings.shape[-1], index_factory, faiss.METRIC_INNER_PRODUCT)
+                if not engine.is_trained:
+                    engine.train(embeddings)
                 engine.add(embeddings)
+            elif embeddings.shape[0] < cls.max_flat_size:
+                # Using flat search on small dataset (backed by the collection's own embeddings)
+                engine = FlatSearchEngine(embeddings)
             else:
                 # Using IVFFlat index on large dataset
                 engine = faiss.IndexIVFFlat(
@@ -25,20 +54,75 @@ class AutoVectorSeachEngine:
                 )
                 engine.train(embeddings)
                 engine.add(embeddings)
+        else:
+            raise ValueError(f"Unknown engine: {engine_name}")
         return engine
 
+    @classmethod
+    def create_codec(cls, embeddings: np.ndarray, storage: str = "float32"):
+        # Compressed storage of the embeddings: codes plus a codebook (trained on the given embeddings)
+        dim = embeddings.shape[-1]
+        if storage == "float16":
+            codec = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        elif storage == "int8":
+            codec = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        elif storage.startswith("pq"):
+            # e.g. "pq64": 64 sub-quantizers of 8 bits (fewer bits on tiny collections, PQ needs 2^nbits training points)
+            num_subquantizers = int(storage[2:])
+            assert dim % num_subquantizers == 0, f"Embedding dimension {dim} is not divisible by {num_subquantizers}"
+            nbits = int(min(8, max(1, np.floor(np.log2(max(embeddings.shape[0], 2))))))
+            codec = faiss.IndexPQ(dim, num_subquantizers, nbits, faiss.METRIC_INNER_PRODUCT)
+        else:
+            raise ValueError(f"Unknown storage: {storage}")
+        if not codec.is_trained:
+            codec.train(np.ascontiguousarray(embeddings, dtype=np.float32))
+        return codec
+
+    @classmethod
+    def get_search_params(cls, engine, nprobe: int = None, ef_search: int = None):
+        # Per-call search-time knobs trading recall for latency, the shared engine itself is never modified
+        # (None: search with the engine's own settings, or the knobs are not applicable, e.g. on a flat index)
+        if not isinstance(engine, faiss.Index) or (nprobe is None and ef_search is None):
+            return None
+        ivf_engine = faiss.try_extract_index_ivf(engine)
+        if ivf_engine is not None:
+            params = faiss.SearchParametersIVF()
+            params.nprobe = nprobe if nprobe is not None else ivf_engine.nprobe
+            if ef_search is not None and isinstance(faiss.downcast_index(ivf_engine.quantizer), faiss.IndexHNSW):
+                # HNSW coarse quantizer (e.g. "IVF65536_HNSW32,PQ64"), keep a reference so it outlives the call
+                params.referenced_objects = [faiss.SearchParametersHNSW(efSearch=ef_search)]
+                params.quantizer_params = params.referenced_objects[0]
+            return params
+        if ef_search is not None and isinstance(faiss.downcast_index(engine), faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=ef_search)
+        return None
+
 
-class VectorCollection:
-    def __init__(self, collection_path: str, engine_name: str = "faiss",):
-        self.collection_path = collection_path
+class VectorCollection(Collection):
+    def __init__(
+            self, 
+            collection_path: str, 
+            engine_name: str = "faiss", 
+            mmap: bool = True, 
+            index_factory: str = None, 
+            storage: str = "float32",
+            passage_store: PassageStore = None,
+        ):
+        super().__init__(collection_path, passage_store=passage_store)
         self.engine_name = engine_name
+        # FAISS factory string of the default engine (None: flat index, or IVFFlat on >1M rows)
+        self.index_factory = index_factory
+        # Storage of the embeddings: "float32" (raw), "float16", "int8" (scalar quantization) or "pq<M>" (product quantization)
+        self.storage = storage
+        # Memory-map the stored embeddings (read-only) instead of reading them into memory
+        self.mmap = mmap
         # Initial parameters
-        self.ids = []
-        self.contents = []
-        self.metadatas = []
-        self.embeddings = None
-        self.unique_ids = set()
+        self.embeddings = None      # Raw float32 embeddings (only until compressed, for compressed storage)
+        self.codec = None           # FAISS index holding the compressed embeddings
+        self.embeddings_checksum = None
         self.default_engine = None
+        self.engine_mmapped = False
+        self.num_saved_rows = 0     # Embeddings already written to disk, later ones are appended on save
         # Load parameters if exists
         if os.path.exists(self.collection_path):
             self.load()
@@ -50,150 +134,356 @@ class VectorCollection:
             vectors: np.ndarray, 
             metadatas: List[Dict[str, Any]],
         ):
-        # Initial embeddings
-        if self.embeddings is None:
-            self.embeddings = np.zeros((1000, vectors.shape[-1]))
-
         # Add doc to index
-        prev_idx = len(self.unique_ids)
-        new_indices = []
-        for index, (content_id, content, metadata) in enumerate(zip(ids, contents, metadatas)):
-            if content_id in self.unique_ids:
-                continue
-            new_indices.append(index)
-            self.ids.append(content_id)
-            self.contents.append(content)
-            self.metadatas.append(metadata)
-            self.unique_ids.add(content_id)
+        prev_idx = len(self.ids)
+        new_indices = self._add_passages(ids, contents, metadatas)
         end_index = prev_idx + len(new_indices)
 
+        if self.codec is not None:
+            # Compress new embeddings with the trained codec
+            if len(new_indices) > 0:
+                self.codec.add(np.ascontiguousarray(vectors[new_indices], dtype=np.float32))
+        else:
+            self._add_embeddings(vectors[new_indices], prev_idx, end_index)
+        if len(new_indices) > 0:
+            self._update_engine(vectors[new_indices])
+
+    def _update_engine(self, vectors: np.ndarray):
+        # Add the new rows to the live engine in place instead of rebuilding it
+        if self.default_engine is None or self.default_engine is self.codec:
+            # Engine is built lazily on first search, or is the codec itself (already updated)
+            return
+        if isinstance(self.default_engine, FlatSearchEngine):
+            # Point the flat search at the (possibly reallocated) embeddings
+            self.default_engine = FlatSearchEngine(self.embeddings[:len(self.ids)])
+            return
+        if self.engine_mmapped:
+            # Memory-mapped engines are read-only, reopen in memory before adding
+            self.default_engine = faiss.read_index(os.path.join(self.collection_path, "engine.index"))
+            self.engine_mmapped = False
+        self.default_engine.add(np.ascontiguousarray(vectors, dtype=np.float32))
+
+    def _add_embeddings(self, vectors: np.ndarray, prev_idx: int, end_index: int):
+        # Initial embeddings
+        if self.embeddings is None:
+            self.embeddings = np.zeros((1000, vectors.shape[-1]), dtype=np.float32)
         # Add embeddings
-        # If embeddings is full, resize it
-        if end_index > self.embeddings.shape[0]:
-            new_size = self.embeddings.shape[0] * 2
-            self.embeddings.resize(new_size, self.embeddings.shape[-1])
+        # If embeddings is full (or read-only memory-mapped), resize it
+        if end_index > self.embeddings.shape[0] or not self.embeddings.flags.writeable:
+            new_size = max(self.embeddings.shape[0], 1000)
+            while new_size < end_index:
+                new_size = new_size * 2
+            embeddings = np.zeros((new_size, self.embeddings.shape[-1]), dtype=np.float32)
+            embeddings[:prev_idx] = self.embeddings[:prev_idx]
+            self.embeddings = embeddings
         # Add new embeddings
-        self.embeddings[prev_idx:end_index] = vectors[new_indices]
+        self.embeddings[prev_idx:end_index] = vectors
+
+    def _compress(self):
+        # Train the codec on the buffered embeddings, then drop the raw copy
+        if self.storage == "float32" or self.codec is not None or self.embeddings is None:
+            return
+        embeddings = self.embeddings[:len(self.ids)]
+        self.codec = AutoVectorSeachEngine.create_codec(embeddings, self.storage)
+        self.codec.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+        self.embeddings = None
+
+    def _get_vectors(self, indices: np.ndarray) -> np.ndarray:
+        # Float32 vectors of the given rows (decoded from the codes for compressed storage)
+        if self.codec is not None:
+            return self.codec.reconstruct_batch(np.asarray(indices, dtype=np.int64))
+        return np.asarray(self.embeddings[indices], dtype=np.float32)
+
+    def compact(self):
+        # Reclaim deleted rows, remaining rows keep their order
+        if len(self.tombstones) == 0:
+            return
+        deleted = self.tombstones.get_mask(len(self.ids))
+        keep_indices = np.flatnonzero(~deleted)
+        self._compact_passages(keep_indices)
+        if self.codec is not None:
+            # Codes are removed in place, later ids are shifted down (same order as the rows)
+            self.codec.remove_ids(faiss.IDSelectorBatch(np.flatnonzero(deleted).astype(np.int64)))
+        else:
+            self.embeddings = np.ascontiguousarray(self.embeddings[keep_indices], dtype=np.float32)
+        # Rebuild the engine and rewrite the stored files on the next save
+        self.default_engine = None
+        self.engine_mmapped = False
+        self.embeddings_checksum = None
+        self.num_saved_rows = 0
+
+    def memory_usage(self) -> int:
+        # Approximate resident bytes (memory-mapped embeddings and engines, and the shared passages are not counted)
+        nbytes = self._get_passages_memory_usage()
+        nbytes += get_array_memory_usage(self.embeddings)
+        if self.codec is not None:
+            nbytes += get_index_memory_usage(self.codec)
+        if isinstance(self.default_engine, faiss.Index) and self.default_engine is not self.codec and not self.engine_mmapped:
+            nbytes += get_index_memory_usage(self.default_engine)
+        return nbytes
+
+    def _search_candidates(self, query_vectors: np.ndarray, candidate_indices: np.ndarray, top_k: int = 3):
+        # Inner products over the gathered candidate rows, one small matmul per call
+        candidate_embeddings = self._get_vectors(candidate_indices)
+        scores = np.asarray(query_vectors, dtype=np.float32) @ candidate_embeddings.T
+        lst_scores, lst_indices = [], []
+        for query_scores in scores:
+            topk_cand_indices = get_topk_indices(query_scores, top_k)
+            lst_scores.append(query_scores[topk_cand_indices])
+            lst_indices.append(candidate_indices[topk_cand_indices])
+        return lst_scores, lst_indices
 
     def search(
             self, 
             query_vector: np.ndarray, 
             top_k: int = 3, 
             candidate_ids: List[str] = None,
+            nprobe: int = None,
+            ef_search: int = None,
         ) -> List[Dict[str, Any]]:
-        # Get search engine
-        if candidate_ids is not None:
-            # If candidate_ids is provided, search only in candidate_ids
-            # To do so, we need to create a new search engine
-            candidate_indices = [self.ids.index(candidate_id) for candidate_id in candidate_ids]
-            engine = AutoVectorSeachEngine.create_engine(self.embeddings[candidate_indices], self.engine_name)
-        else:
-            candidate_indices = np.arange(len(self.unique_ids))
-            if self.default_engine is None:
-                self.default_engine = AutoVectorSeachEngine.create_engine(self.embeddings, self.engine_name)
-            engine = self.default_engine
-
-        # Search
-        lst_scores, lst_indices = engine.search(query_vector, k=top_k)
-        results = []
-        for score, cand_index in zip(lst_scores[0], lst_indices[0]):
-            # Filter indices that exceed the number of documents
-            if cand_index >= len(candidate_indices):
+        return self.batch_search(
+            query_vector, 
+            top_k=top_k, 
+            candidate_idss=[candidate_ids] if candidate_ids is not None else None,
+            nprobe=nprobe,
+            ef_search=ef_search,
+        )[0]
+
+    def batch_search(
+            self, 
+            query_vectors: np.ndarray, 
+            top_k: int = 3, 
+            candidate_idss: List[List[str]] = None,
+            nprobe: int = None,
+            ef_search: int = None,
+        ) -> List[List[Dict[str, Any]]]:
+        # Queries without candidate ids (None) search the whole collection
+        if candidate_idss is None:
+            candidate_idss = [None] * len(query_vectors)
+        lst_scores, lst_indices = [None] * len(query_vectors), [None] * len(query_vectors)
+        engine_query_indices = []
+        for query_index, (query_vector, candidate_ids) in enumerate(zip(query_vectors, candidate_idss)):
+            if candidate_ids is None:
+                engine_query_indices.append(query_index)
                 continue
-            real_index = candidate_indices[cand_index]
-            results.append({
-                "id": self.ids[real_index],
-                "content": self.contents[real_index],
-                "metadata": self.metadatas[real_index],
-                "score": score,
-            })
-            
-        # Normalize scores
-        results = normalize_score(results)
-        return results
+            # Score only the candidate rows of the query directly
+            candidate_indices = self.get_indices(candidate_ids)
+            scores, indices = self._search_candidates(query_vector[None, :], candidate_indices, top_k=top_k)
+            lst_scores[query_index], lst_indices[query_index] = scores[0], indices[0]
+        if len(engine_query_indices) > 0:
+            # Get search engine
+            if self.default_engine is None:
+                self.default_engine = self._create_engine()
+            search_params = AutoVectorSeachEngine.get_search_params(self.default_engine, nprobe=nprobe, ef_search=ef_search)
+            search_kwargs = {"params": search_params} if search_params is not None else {}
+            # Search all remaining queries at once (over-fetch by the number of deleted rows, which are filtered below)
+            engine_scores, engine_indices = self.default_engine.search(
+                np.asarray(query_vectors, dtype=np.float32)[engine_query_indices], 
+                k=top_k + len(self.tombstones), 
+                **search_kwargs,
+            )
+            for query_index, scores, indices in zip(engine_query_indices, engine_scores, engine_indices):
+                lst_scores[query_index], lst_indices[query_index] = scores, indices
+
+        resultss = []
+        for scores, indices in zip(lst_scores, lst_indices):
+            results = []
+            for score, real_index in zip(scores, indices):
+                # Filter missing results (FAISS pads with -1 when fewer than top_k documents are found) and deleted rows
+                if real_index < 0 or self.tombstones.is_deleted(real_index):
+                    continue
+                if len(results) >= top_k:
+                    break
+                results.append({
+                    "id": self.ids[real_index],
+                    "content": self.contents[real_index],
+                    "metadata": self.metadatas[real_index],
+                    "score": score,
+                })
+            # Normalize scores
+            resultss.append(normalize_score(results))
+        return resultss
     
+    def has_unsaved_changes(self) -> bool:
+        return super().has_unsaved_changes() or self.num_saved_rows < len(self.ids)
+
     def save(self):
         # Create save_dir if not exists
         if not os.path.exists(self.collection_path):
             os.makedirs(self.collection_path)
 
-        if len(self.unique_ids) > 0:
-            with open(os.path.join(self.collection_path, "corpus.jsonl"), "w", encoding="utf-8") as f:
-                for content_id, content, metadata in zip(self.ids, self.contents, self.metadatas):
-                    f.write(json.dumps({
-                        "id": content_id,
-                        "content": content,
-                        "metadata": metadata,
-                    }, ensure_ascii=False))
-                    f.write("\n")
-            # Save embeddings
-            pickle.dump(self.embeddings, open(os.path.join(self.collection_path, "embeddings.pkl"), "wb"))
-        
-    def load(self):
-        # Check if index_dir exists
-        assert os.path.exists(self.collection_path), f"Index directory not found: {self.collection_path}"
-
-        if os.path.exists(os.path.join(self.collection_path, "embeddings.pkl")):
-            self.ids = []
-            self.contents = []
-            self.metadatas = []
-            self.unique_ids = set()
-            with open(os.path.join(self.collection_path, "corpus.jsonl"), "rb") as f:
-                for line in f:
-                    data = json.loads(line)
-                    self.ids.append(data["id"])
-                    self.contents.append(data["content"])
-                    self.metadatas.append(data["metadata"])
-                    self.unique_ids.add(data["id"])
-            # Load embeddings
-            self.embeddings = pickle.load(open(os.path.join(self.collection_path, "embeddings.pkl"), "rb"))
-            # Load search engine
-            self.default_engine = AutoVectorSeachEngine.create_engine(self.embeddings, self.engine_name)
+        if len(self.ids) > 0 and (self.num_saved_rows < len(self.ids) or self.corpus_changed):
+            # Save embeddings first, then the rows, the embeddings header (written last) marks the rows as saved
+            header = self._save_embeddings() if self.num_saved_rows < len(self.ids) else None
+            self._save_passages()
+            if header is not None:
+                save_json(header, os.path.join(self.collection_path, "embeddings.json"))
+            self.num_saved_rows = len(self.ids)
+            self.corpus_changed = False
+        if len(self.ids) > 0:
+            # Save search engine (flat search and codec engines have nothing more to save)
+            if self.default_engine is None:
+                self.default_engine = self._create_engine()
+            if isinstance(self.default_engine, faiss.Index) and self.default_engine is not self.codec:
+                self._save_engine()
+            # Save config
+            config = {
+                "engine_name": self.engine_name,
+                "index_factory": self.index_factory,
+                "storage": self.storage,
+                "version": self.version,
+            }
+            save_json(config, os.path.join(self.collection_path, "config.json"))
 
+    def _can_append(self, file_path: str, row_size: int) -> bool:
+        # The stored file holds exactly the saved rows, so only the new rows need to be written
+        return self.num_saved_rows > 0 and self.embeddings_checksum is not None and \
+            os.path.exists(file_path) and os.path.getsize(file_path) == self.num_saved_rows * row_size
 
-class VectorDB:
-    def __init__(self, database_path: str):
-        self.database_path = database_path
+    def _save_embeddings(self) -> Dict[str, Any]:
+        if self.storage == "float32":
+            # Save embeddings as a trimmed float32 matrix (raw binary) with a small header
+            embeddings_path = os.path.join(self.collection_path, "embeddings.bin")
+            embeddings = self.embeddings[:len(self.ids)]
+            shape = list(embeddings.shape)
+            if self._can_append(embeddings_path, shape[-1] * 4):
+                # Append only the delta, the checksum is chained over the appended segments
+                delta = np.ascontiguousarray(embeddings[self.num_saved_rows:], dtype=np.float32)
+                with open(embeddings_path, "ab") as f:
+                    delta.tofile(f)
+                delta_checksum = hashlib.sha256(delta.tobytes()).hexdigest()
+                self.embeddings_checksum = hashlib.sha256((self.embeddings_checksum + delta_checksum).encode("utf-8")).hexdigest()
+            else:
+                with open(embeddings_path + ".tmp", "wb") as f:
+                    np.ascontiguousarray(embeddings, dtype=np.float32).tofile(f)
+                # Swap the files, readers that memory-mapped the old file are unaffected
+                os.replace(embeddings_path + ".tmp", embeddings_path)
+                self.embeddings_checksum = file_checksum(embeddings_path)
+        else:
+            # Save only the codes and codebook (rewritten as a whole, they are small)
+            self._compress()
+            embeddings_path = os.path.join(self.collection_path, "embeddings.index")
+            faiss.write_index(self.codec, embeddings_path + ".tmp")
+            os.replace(embeddings_path + ".tmp", embeddings_path)
+            self.embeddings_checksum = file_checksum(embeddings_path)
+            shape = [self.codec.ntotal, self.codec.d]
+        if self.storage == "float32" and self.mmap:
+            # Continue from the trimmed file, releasing the padded in-memory buffer
+            self.embeddings = np.memmap(embeddings_path, dtype=np.float32, mode="r", shape=tuple(shape))
+            if isinstance(self.default_engine, FlatSearchEngine):
+                self.default_engine = None
+        return {
+            "storage": self.storage,
+            "dtype": "float32",
+            "shape": shape,
+            "checksum": self.embeddings_checksum,
+        }
 
-        self.collections = {}       # {name: VectorCollection}
-        self.collection_paths = {}  # {name: path}
+    def _create_engine(self):
+        self._compress()
+        if self.codec is not None and self.index_factory is None:
+            # Exhaustive search directly over the codes, no second copy of the embeddings
+            return self.codec
+        # Trimmed view of the raw embeddings (decoded vectors for compressed storage)
+        embeddings = self.embeddings[:len(self.ids)] if self.codec is None else self._get_vectors(np.arange(len(self.ids)))
+        return AutoVectorSeachEngine.create_engine(embeddings, self.engine_name, self.index_factory)
 
-        if os.path.exists(self.database_path):
-            self.load()
+    def _get_engine_key(self) -> str:
+        # The engine is only reusable if both the embeddings and the engine parameters are unchanged
+        engine_params = {
+            "embeddings_checksum": self.embeddings_checksum,
+            "engine_name": self.engine_name,
+            "index_factory": self.index_factory,
+            "storage": self.storage,
+        }
+        return hashlib.sha256(json.dumps(engine_params, sort_keys=True).encode("utf-8")).hexdigest()
 
-    def get_collection_names(self) -> List[str]:
-        return list(self.collection_paths.keys())
+    def _save_engine(self):
+        engine_path = os.path.join(self.collection_path, "engine.index")
+        engine_config_path = os.path.join(self.collection_path, "engine.json")
+        # Skip if the stored engine is already up to date
+        if os.path.exists(engine_config_path) and json.load(open(engine_config_path, "r"))["key"] == self._get_engine_key():
+            return
+        # Engines can not be appended, the updated engine is rewritten as a whole
+        faiss.write_index(self.default_engine, engine_path + ".tmp")
+        os.replace(engine_path + ".tmp", engine_path)
+        save_json({"key": self._get_engine_key()}, os.path.join(self.collection_path, "engine.json"))
 
-    def create_or_get_collection(self, name: str) -> VectorCollection:
-        if name not in self.collection_paths:
-            self.collection_paths[name] = os.path.join(self.database_path, name)
-            self.collections[name] = VectorCollection(self.collection_paths[name])
-        if name not in self.collections:
-            self.collections[name] = VectorCollection(self.collection_paths[name])
-        return self.collections[name]
-    
-    def get_collection(self, name: str) -> VectorCollection:
-        assert name in self.collection_paths, f"Collection not found: {name}"
-        if name not in self.collections:
-            self.collections[name] = VectorCollection(self.collection_paths[name])
-        return self.collections[name]
+    def _load_engine(self):
+        if self.index_factory is None and (self.codec is not None or len(self.ids) < AutoVectorSeachEngine.max_flat_size):
+            # Codec or flat search, built directly on the loaded embeddings
+            return self._create_engine()
+        engine_path = os.path.join(self.collection_path, "engine.index")
+        engine_config_path = os.path.join(self.collection_path, "engine.json")
+        if self.embeddings_checksum is not None and os.path.exists(engine_config_path):
+            engine_config = json.load(open(engine_config_path, "r"))
+            if engine_config["key"] == self._get_engine_key():
+                # Reuse the persisted engine
+                self.engine_mmapped = self.mmap
+                return faiss.read_index(engine_path, faiss.IO_FLAG_MMAP if self.mmap else 0)
+        # Rebuild the engine in memory, loading never writes (read-only serving processes share the files),
+        # the rebuilt engine is persisted by the next save()
+        return self._create_engine()
+        
+    def _load_embeddings(self) -> np.ndarray:
+        embeddings_path = os.path.join(self.collection_path, "embeddings.bin")
+        if not os.path.exists(embeddings_path):
+            # Legacy format: pickled (padded, float64) embeddings
+            embeddings = pickle.load(open(os.path.join(self.collection_path, "embeddings.pkl"), "rb"))
+            return np.ascontiguousarray(embeddings[:len(self.ids)], dtype=np.float32)
 
-    def save(self):
-        # Create save_dir if not exists
-        if not os.path.exists(self.database_path):
-            os.makedirs(self.database_path)
+        header = json.load(open(os.path.join(self.collection_path, "embeddings.json"), "r"))
+        shape = tuple(header["shape"])
+        self.embeddings_checksum = header.get("checksum")
+        if self.mmap:
+            # Read-only memory mapping lets several processes share one page-cache copy
+            return np.memmap(embeddings_path, dtype=header["dtype"], mode="r", shape=shape)
+        return np.fromfile(embeddings_path, dtype=header["dtype"]).reshape(shape)
 
-        if len(self.collection_paths) > 0:
-            # Save collection paths
-            json.dump(self.collection_paths, open(os.path.join(self.database_path, "collection_paths.json"), "w"))
-            # Save collections
-            for collection in self.collections.values():
-                collection.save()
+    def _load_codec(self):
+        header = json.load(open(os.path.join(self.collection_path, "embeddings.json"), "r"))
+        self.embeddings_checksum = header.get("checksum")
+        return faiss.read_index(os.path.join(self.collection_path, "embeddings.index"))
 
     def load(self):
         # Check if index_dir exists
-        assert os.path.exists(self.database_path), f"Index directory not found: {self.database_path}"
+        assert os.path.exists(self.collection_path), f"Index directory not found: {self.collection_path}"
 
-        if os.path.exists(os.path.join(self.database_path, "collection_paths.json")):
-            # Load collection paths
-            self.collection_paths = json.load(open(os.path.join(self.database_path, "collection_paths.json"), "r"))
\ No newline at end of file
+        if os.path.exists(os.path.join(self.collection_path, "embeddings.json")) or \
+                os.path.exists(os.path.join(self.collection_path, "embeddings.pkl")):
+            # Only rows covered by the embeddings header are saved (an interrupted save may leave extra rows)
+            num_rows = None
+            if os.path.exists(os.path.join(self.collection_path, "embeddings.json")):
+                num_rows = json.load(open(os.path.join(self.collection_path, "embeddings.json"), "r"))["shape"][0]
+            if not self._load_passages(num_rows):
+                self._set_passages(*self._read_legacy_corpus(num_rows))
+            self.num_saved_rows = len(self.ids)
+            # Load config
+            if os.path.exists(os.path.join(self.collection_path, "config.json")):
+                config = json.load(open(os.path.join(self.collection_path, "config.json"), "r"))
+                self.engine_name = config["engine_name"]
+                self.index_factory = config["index_factory"]
+                self.storage = config.get("storage", "float32")
+                self.version = config.get("version", self.version)
+            # Load embeddings (or their codes)
+            if self.storage == "float32":
+                self.embeddings = self._load_embeddings()
+            else:
+                self.codec = self._load_codec()
+            # Load search engine
+            self.default_engine = self._load_engine()
+
+
+class VectorDB(Database):
+    def __init__(self, database_path: str, mmap: bool = True, memory_budget: int = None, passage_store_path: str = None):
+        self.mmap = mmap
+        super().__init__(database_path, memory_budget=memory_budget, passage_store_path=passage_store_path)
+
+    def _create_collection(self, collection_path: str, index_factory: str = None, storage: str = "float32") -> VectorCollection:
+        return VectorCollection(collection_path, mmap=self.mmap, index_factory=index_factory, storage=storage, passage_store=self.passage_store)
+
+    def create_or_get_collection(self, name: str, index_factory: str = None, storage: str = "float32") -> VectorCollection:
+        return super().create_or_get_collection(name, index_factory=index_factory, storage=storage)
+
+    def get_collection(self, name: str) -> VectorCollection:
+        return super().get_collection(name)
@@ -1,8 +1,26 @@
-from typing import List, Union
+import torch
+import numpy as np
+from torch import Tensor
+from dataclasses import dataclass
+from typing import List, Dict, Union, Any
 from abc import ABC, abstractmethod
 
 
+@dataclass
+class PreparedPassages:
+    batches: List[Any]          # Collated model inputs, one per length bucket
+    order: np.ndarray           # Original positions of the passages, in bucket order
+    num_tokens: int             # Real (unpadded) passage length
+    num_padded_tokens: int      # Passage length after padding each bucket
+
+
 class SentenceEncoder(ABC):
+    # Token budget (batch size * longest passage) of length-bucketed passage batches, None disables bucketing
+    max_tokens_per_batch: int = None
+    # Padding statistics
+    num_passage_tokens: int = 0
+    num_padded_passage_tokens: int = 0
+
     @abstractmethod
     def _encode_queries(self, queries: List[str]):
         raise NotImplementedError
@@ -11,6 +29,18 @@ class SentenceEncoder(ABC):
     def _encode_passages(self, passages: List[str]):
         raise NotImplementedError
 
+    def _set_num_threads(self, intra_op_threads: int = None, inter_op_threads: int = None):
+        pass
+
+    def set_num_threads(self, intra_op_threads: int = None, inter_op_threads: int = None):
+        # CPU thread pools used by the model runtime (None keeps the runtime default)
+        self._set_num_threads(intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
+
+    def set_query_backend(self, backend: str = "torch", onnx_dir: str = None, intra_op_threads: int = None, inter_op_threads: int = None):
+        # Runtime used to encode queries: "torch", "onnx" or "onnx_int8" (ONNX Runtime with dynamic int8 quantization)
+        if backend != "torch":
+            raise ValueError(f"Unsupported query backend for {self.__class__.__name__}: {backend}")
+
     def encode_queries(self, queries: Union[List[str], str], return_numpy: bool = True):
         if isinstance(queries, str):
             queries = [queries]
@@ -21,13 +51,179 @@ class SentenceEncoder(ABC):
             embedings = embedings.numpy()
         return embedings
     
-    def encode_passages(self, passages: Union[List[str], str], return_numpy: bool = True):
+    def _tokenize_passages(self, passages: List[str]) -> List[Any]:
+        # Per-passage model inputs, by default the raw passages (tokenized inside _encode_passages)
+        return passages
+
+    def _passage_length(self, item: Any) -> int:
+        # Length used for bucketing and padding statistics (characters for raw passages)
+        return len(item)
+
+    def _collate_passages(self, items: List[Any]) -> Any:
+        return items
+
+    def _encode_passage_batch(self, batch: Any):
+        return self._encode_passages(batch)
+
+    def _create_buckets(self, lengths: np.ndarray) -> List[np.ndarray]:
+        if self.max_tokens_per_batch is None:
+            return [np.arange(len(lengths))]
+        # Sort by length and grow each batch while (batch size * longest passage) fits the token budget
+        buckets = []
+        bucket = []
+        for index in np.argsort(lengths, kind="stable"):
+            if len(bucket) > 0 and lengths[index] * (len(bucket) + 1) > self.max_tokens_per_batch:
+                buckets.append(np.array(bucket))
+                bucket = []
+            bucket.append(index)
+        if len(bucket) > 0:
+            buckets.append(np.array(bucket))
+        return buckets
+
+    def prepare_passages(self, passages: Union[List[str], str]) -> PreparedPassages:
+        # Python-side preparation (tokenization, bucketing, padding), can run ahead of encoding in a background thread
         if isinstance(passages, str):
             passages = [passages]
+        items = self._tokenize_passages(passages)
+        lengths = np.array([self._passage_length(item) for item in items], dtype=np.int64)
+        buckets = self._create_buckets(lengths)
+        return PreparedPassages(
+            batches=[self._collate_passages([items[index] for index in bucket]) for bucket in buckets],
+            order=np.concatenate(buckets) if len(buckets) > 0 else np.zeros(0, dtype=np.int64),
+            num_tokens=int(lengths.sum()),
+            num_padded_tokens=int(sum(lengths[bucket].max() * len(bucket) for bucket in buckets if len(bucket) > 0)),
+        )
+
+    def encode_prepared_passages(self, prepared_passages: PreparedPassages, return_numpy: bool = True):
         # Encode passages
-        embedings = self._encode_passages(passages)
-        # Cast to numpy
-        if return_numpy:
-            embedings = embedings.numpy()
+        embedingss = [self._encode_passage_batch(batch) for batch in prepared_passages.batches]
+        # Update padding statistics
+        self.num_passage_tokens += prepared_passages.num_tokens
+        self.num_padded_passage_tokens += prepared_passages.num_padded_tokens
+        # Bucketing sorts the passages by length even when they all fit in one batch
+        in_order = np.array_equal(prepared_passages.order, np.arange(len(prepared_passages.order)))
+        if not return_numpy:
+            assert len(embedingss) == 1 and in_order, "Length-bucketed passages can only be returned as numpy"
+            return embedingss[0]
+        # Cast to numpy and restore the original order
+        embedings = np.concatenate([embedings.numpy() for embedings in embedingss], axis=0)
+        if not in_order:
+            restored_embedings = np.empty_like(embedings)
+            restored_embedings[prepared_passages.order] = embedings
+            embedings = restored_embedings
         return embedings
-        
\ No newline at end of file
+    
+    def encode_passages(self, passages: Union[List[str], str], return_numpy: bool = True):
+        if not return_numpy:
+            # Tensor outputs are not reordered, so encode as a single batch
+            return self._encode_passage_batch(self._collate_passages(self._tokenize_passages(
+                [passages] if isinstance(passages, str) else passages
+            )))
+        return self.encode_prepared_passages(self.prepare_passages(passages), return_numpy=return_numpy)
+
+    def get_padding_efficiency(self) -> float:
+        # Fraction of encoded passage tokens that are real (not padding)
+        if self.num_padded_passage_tokens == 0:
+            return 1.0
+        return self.num_passage_tokens / self.num_padded_passage_tokens
+
+
+class TorchSentenceEncoder(SentenceEncoder):
+    # Shared PyTorch encoder: passages (and queries, unless _encode_queries is overridden) go through self.model
+    # Query runtimes accepted by set_query_backend
+    supported_query_backends: List[str] = ["torch"]
+    # ONNX Runtime session used for queries (None: use the PyTorch model)
+    query_backend = None
+    max_length: int = 512
+
+    def _format_queries(self, queries: List[str]) -> List[str]:
+        return queries
+
+    def _format_passages(self, passages: List[str]) -> List[str]:
+        return passages
+
+    def _mean_pooling(self, last_hidden_states: Tensor, attention_mask: Tensor) -> Tensor:
+        last_hidden = last_hidden_states.masked_fill(~attention_mask[..., None].bool(), 0.0)
+        return last_hidden.sum(dim=1) / attention_mask.sum(dim=1)[..., None]
+
+    def _pool(self, last_hidden_states: Tensor, attention_mask: Tensor) -> Tensor:
+        return self._mean_pooling(last_hidden_states, attention_mask)
+
+    def _pool_outputs(self, outputs, attention_mask: Tensor) -> Tensor:
+        return self._pool(outputs[0], attention_mask)
+
+    def _set_num_threads(self, intra_op_threads: int = None, inter_op_threads: int = None):
+        if intra_op_threads is not None:
+            torch.set_num_threads(intra_op_threads)
+        if inter_op_threads is not None:
+            try:
+                torch.set_num_interop_threads(inter_op_threads)
+            except RuntimeError:
+                # Inter-op threads can only be set once, before any inter-op parallel work has started
+                pass
+
+    def set_query_backend(self, backend: str = "torch", onnx_dir: str = None, intra_op_threads: int = None, inter_op_threads: int = None):
+        if backend not in self.supported_query_backends:
+            raise ValueError(f"Unsupported query backend for {self.__class__.__name__}: {backend}")
+        if backend == "torch":
+            self.query_backend = None
+        else:
+            # Imported here, ONNX Runtime is only needed for this backend
+            from mkr.models.retrieval.onnx_backend import ONNXEncoderBackend
+            assert onnx_dir is not None, "onnx_dir is required for the ONNX query backend"
+            self.query_backend = ONNXEncoderBackend.from_model(
+                self.model, 
+                self.tokenizer, 
+                onnx_dir, 
+                quantize=backend == "onnx_int8", 
+                intra_op_threads=intra_op_threads, 
+                inter_op_threads=inter_op_threads,
+            )
+
+    def _forward_onnx(self, texts: List[str]) -> Tensor:
+        inputs = self.tokenizer(texts, max_length=self.max_length, padding=True, truncation=True, return_tensors="np")
+        last_hidden_state = torch.from_numpy(self.query_backend(inputs))
+        return self._pool(last_hidden_state, torch.from_numpy(inputs["attention_mask"]))
+
+    def _forward(self, inputs, model=None) -> Tensor:
+        model = model if model is not None else self.model
+        # Use GPU if available
+        if torch.cuda.is_available():
+            inputs = {key: value.cuda() for key, value in inputs.items()}
+
+        # No autograd graph or retained activations for inference
+        with torch.inference_mode():
+            outputs = model(**inputs)
+        embeddings = self._pool_outputs(outputs, inputs["attention_mask"])
+
+        # Move to CPU if needed
+        if torch.cuda.is_available():
+            embeddings = embeddings.cpu()
+        return embeddings
+
+    def _encode(self, texts: List[str], tokenizer=None, model=None) -> Tensor:
+        tokenizer = tokenizer if tokenizer is not None else self.tokenizer
+        inputs = tokenizer(texts, max_length=self.max_length, padding=True, truncation=True, return_tensors="pt")
+        return self._forward(inputs, model=model)
+
+    def _encode_queries(self, queries: List[str]) -> Tensor:
+        queries = self._format_queries(queries)
+        if self.query_backend is not None:
+            return self._forward_onnx(queries)
+        return self._encode(queries)
+
+    def _encode_passages(self, passages: List[str]) -> Tensor:
+        return self._encode(self._format_passages(passages))
+
+    def _tokenize_passages(self, passages: List[str]) -> List[Dict[str, List[int]]]:
+        inputs = self.tokenizer(self._format_passages(passages), max_length=self.max_length, truncation=True)
+        return [{key: value[index] for key, value in inputs.items()} for index in range(len(passages))]
+
+    def _passage_length(self, item: Dict[str, List[int]]) -> int:
+        return len(item["input_ids"])
+
+    def _collate_passages(self, items: List[Dict[str, List[int]]]):
+        return self.tokenizer.pad(items, return_tensors="pt")
+
+    def _encode_passage_batch(self, inputs) -> Tensor:
+        return self._forward(inputs)
@@ -1,13 +1,12 @@
 import torch
 from typing import List
 from torch import Tensor
-from torch.functional import F
-from mkr.models.retrieval.baseclass import SentenceEncoder
+from mkr.models.retrieval.baseclass import TorchSentenceEncoder
 from transformers import AutoTokenizer, AutoModel
 from mkr.resources.resource_manager import ResourceManager
 
 
-class mDPRSentenceEncoder(SentenceEncoder):
+class mDPRSentenceEncoder(TorchSentenceEncoder):
     def __init__(self, model_name: str = "mDPR"):
         assert model_name in self.available_models, f"Unknown query model name: {model_name}"
 
@@ -28,35 +27,16 @@ class mDPRSentenceEncoder(SentenceEncoder):
         if torch.cuda.is_available():
             self.query_model = self.query_model.cuda()
             self.passage_model = self.passage_model.cuda()
+        # Passages are tokenized and encoded with the passage model
+        self.tokenizer = self.passage_tokenizer
+        self.model = self.passage_model
     
-    def _encode_queries(self, queries: List[str]) -> Tensor:
-        inputs = self.query_tokenizer(queries, max_length=512, padding=True, truncation=True, return_tensors="pt")
-        # Use GPU if available
-        if torch.cuda.is_available():
-            inputs = {key: value.cuda() for key, value in inputs.items()}
-
-        outputs = self.query_model(**inputs)
-        embeddings = outputs.pooler_output
-
-        # Move to CPU if needed
-        if torch.cuda.is_available():
-            embeddings = embeddings.cpu()
-        return embeddings.detach()
-    
-    def _encode_passages(self, passages: List[str]) -> Tensor:
-        inputs = self.passage_tokenizer(passages, max_length=512, padding=True, truncation=True, return_tensors="pt")
-        # Use GPU if available
-        if torch.cuda.is_available():
-            inputs = {key: value.cuda() for key, value in inputs.items()}
+    def _pool_outputs(self, outputs, attention_mask: Tensor) -> Tensor:
+        return outputs.pooler_output
 
-        outputs = self.passage_model(**inputs)
-        embeddings = outputs.pooler_output
+    def _encode_queries(self, queries: List[str]) -> Tensor:
+        return self._encode(queries, tokenizer=self.query_tokenizer, model=self.query_model)
 
-        # Move to CPU if needed
-        if torch.cuda.is_available():
-            embeddings = embeddings.cpu()
-        return embeddings.detach()
-    
     def get_query_model_name(self, model_name):
         mapping = {
             "mDPR": "mDPR_query",
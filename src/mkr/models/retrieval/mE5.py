@@ -3,11 +3,13 @@ from typing import List
 from torch import Tensor
 from torch.functional import F
 from transformers import AutoTokenizer, AutoModel
-from mkr.models.retrieval.baseclass import SentenceEncoder
+from mkr.models.retrieval.baseclass import TorchSentenceEncoder
 from mkr.resources.resource_manager import ResourceManager
 
 
-class mE5SentenceEncoder(SentenceEncoder):
+class mE5SentenceEncoder(TorchSentenceEncoder):
+    supported_query_backends = ["torch", "onnx", "onnx_int8"]
+
     def __init__(self, model_checkpoint: str):
         self.resource_manager = ResourceManager()
         self.tokenizer = AutoTokenizer.from_pretrained(model_checkpoint)
@@ -18,33 +20,16 @@ class mE5SentenceEncoder(SentenceEncoder):
         if torch.cuda.is_available():
             self.model = self.model.cuda()
 
-    def _average_pooling(self, last_hidden_states: Tensor, attention_mask: Tensor) -> Tensor:
-        last_hidden = last_hidden_states.masked_fill(~attention_mask[..., None].bool(), 0.0)
-        return last_hidden.sum(dim=1) / attention_mask.sum(dim=1)[..., None]
-    
-    def _encode(self, texts: List[str]) -> Tensor:
-        inputs = self.tokenizer(texts, max_length=512, padding=True, truncation=True, return_tensors="pt")
-        # Use GPU if available
-        if torch.cuda.is_available():
-            inputs = {key: value.cuda() for key, value in inputs.items()}
+    def _pool(self, last_hidden_states: Tensor, attention_mask: Tensor) -> Tensor:
+        embeddings = self._mean_pooling(last_hidden_states, attention_mask)
+        return F.normalize(embeddings, p=2, dim=1)
 
-        outputs = self.model(**inputs)
-        embeddings = self._average_pooling(outputs.last_hidden_state, inputs["attention_mask"])
-        embeddings = F.normalize(embeddings, p=2, dim=1)
+    def _format_queries(self, queries: List[str]) -> List[str]:
+        return [f"query: {query}" for query in queries]
+
+    def _format_passages(self, passages: List[str]) -> List[str]:
+        return [f"passage: {passage}" for passage in passages]
 
-        # Move to CPU if needed
-        if torch.cuda.is_available():
-            embeddings = embeddings.cpu()
-        return embeddings
-    
-    def _encode_queries(self, queries: List[str]) -> Tensor:
-        queries = [f"query: {query}" for query in queries]
-        return self._encode(queries).detach()
-    
-    def _encode_passages(self, passages: List[str]) -> Tensor:
-        passages = [f"passage: {passage}" for passage in passages]
-        return self._encode(passages).detach()
-    
 
 # if __name__ == "__main__":
 #     encoder = mE5SentenceEncoder("mE5_small")
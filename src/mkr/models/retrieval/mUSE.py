@@ -12,6 +12,16 @@ class mUSESentenceEncoder(SentenceEncoder):
         self.resource_manager = ResourceManager()
         self.model = tensorflow_hub.load(self.resource_manager.get_encoder_path(model_name))
 
+    def _set_num_threads(self, intra_op_threads: int = None, inter_op_threads: int = None):
+        try:
+            if intra_op_threads is not None:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+            if inter_op_threads is not None:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        except RuntimeError:
+            # Threading can only be configured before the TensorFlow runtime is initialized
+            pass
+
     def _encode(self, texts: List[str]) -> tf.Tensor:
         return self.model(texts)
     
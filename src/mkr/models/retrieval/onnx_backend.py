@@ -0,0 +1,123 @@
+import os
+import copy
+import json
+import torch
+import hashlib
+import inspect
+import numpy as np
+from typing import Dict
+from torch import Tensor
+
+
+class _LastHiddenState(torch.nn.Module):
+    # Export only the last hidden state, pooling stays in the encoder
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids: Tensor, attention_mask: Tensor) -> Tensor:
+        return self.model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+
+def get_model_fingerprint(model) -> str:
+    # Checksum of the model config and weights, identifies the model an export was made from
+    checksum = hashlib.sha256()
+    config = getattr(model, "config", None)
+    if config is not None:
+        checksum.update(config.to_json_string(use_diff=False).encode("utf-8"))
+    for name, tensor in model.state_dict().items():
+        checksum.update(name.encode("utf-8"))
+        checksum.update(tensor.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy().tobytes())
+    return checksum.hexdigest()
+
+
+class ONNXEncoderBackend:
+    def __init__(self, onnx_path: str, intra_op_threads: int = None, inter_op_threads: int = None):
+        # ONNX Runtime is an optional dependency, only needed for this backend
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("onnxruntime is required for the ONNX query backend: pip install onnxruntime")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads is not None:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads is not None:
+            options.inter_op_num_threads = inter_op_threads
+        self.onnx_path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    @staticmethod
+    def export(model, tokenizer, onnx_dir: str, quantize: bool = True) -> str:
+        # Export once (fp32), then quantize the weights to int8 dynamically (activations are quantized at runtime)
+        if not os.path.exists(onnx_dir):
+            os.makedirs(onnx_dir)
+        fp32_path = os.path.join(onnx_dir, "model.onnx")
+        int8_path = os.path.join(onnx_dir, "model.int8.onnx")
+        fingerprint_path = os.path.join(onnx_dir, "fingerprint.json")
+        # Exports of another model (e.g. another checkpoint in the same onnx_dir) are stale
+        fingerprint = get_model_fingerprint(model)
+        if not os.path.exists(fingerprint_path) or json.load(open(fingerprint_path, "r"))["fingerprint"] != fingerprint:
+            for path in [fingerprint_path, fp32_path, int8_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+        if not os.path.exists(fp32_path):
+            inputs = tokenizer(["export"], return_tensors="pt")
+            # Export from a CPU copy of the model in float32
+            model = _LastHiddenState(copy.deepcopy(model)).cpu().float().eval()
+            # Use the TorchScript exporter (newer PyTorch defaults to the dynamo exporter, which needs onnxscript)
+            export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+            torch.onnx.export(
+                model,
+                (inputs["input_ids"], inputs["attention_mask"]),
+                fp32_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"},
+                },
+                opset_version=14,
+                **export_kwargs,
+            )
+            with open(fingerprint_path + ".tmp", "w") as f:
+                json.dump({"fingerprint": fingerprint}, f)
+            os.replace(fingerprint_path + ".tmp", fingerprint_path)
+        if not quantize:
+            return fp32_path
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        return int8_path
+
+    @classmethod
+    def from_model(
+            cls,
+            model,
+            tokenizer,
+            onnx_dir: str,
+            quantize: bool = True,
+            intra_op_threads: int = None,
+            inter_op_threads: int = None,
+        ) -> "ONNXEncoderBackend":
+        onnx_path = cls.export(model, tokenizer, onnx_dir, quantize=quantize)
+        return cls(onnx_path, intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
+
+    def __call__(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        # Returns the last hidden state (batch, sequence, hidden)
+        feeds = {name: np.asarray(inputs[name], dtype=np.int64) for name in self.input_names}
+        return self.session.run(None, feeds)[0]
+
+
+def check_embedding_parity(reference_embeddings: np.ndarray, embeddings: np.ndarray) -> Dict[str, float]:
+    # Cosine similarity between the reference (PyTorch) and the ONNX embeddings of the same inputs
+    reference_embeddings = reference_embeddings / np.linalg.norm(reference_embeddings, axis=-1, keepdims=True)
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    similarities = np.sum(reference_embeddings * embeddings, axis=-1)
+    return {
+        "min_cosine": float(similarities.min()),
+        "mean_cosine": float(similarities.mean()),
+    }
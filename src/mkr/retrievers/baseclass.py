@@ -1,7 +1,24 @@
 from abc import ABC, abstractmethod
+from typing import List, Dict, Any
 
 
 class Retriever(ABC):
     @abstractmethod
     def __call__(self, query: str, top_k: int = 3):
-        NotImplementedError
\ No newline at end of file
+        NotImplementedError
+
+    def get_corpus_version(self, corpus_name: str) -> str:
+        # Content version of the corpus, None if the retriever does not track it (results are then not cached)
+        return None
+
+    def batch_search(
+            self, 
+            corpus_name: str, 
+            queries: List[str], 
+            top_k: int = 3, 
+            candidate_idss: List[List[str]] = None,
+        ) -> List[List[Dict[str, Any]]]:
+        # Fallback: one call per query
+        if candidate_idss is None:
+            candidate_idss = [None] * len(queries)
+        return [self(corpus_name, query, top_k=top_k, candidate_ids=candidate_ids) for query, candidate_ids in zip(queries, candidate_idss)]
@@ -0,0 +1,153 @@
+import copy
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any
+from mkr.retrievers.baseclass import Retriever
+from mkr.utilities.cache_utils import LRUCache
+
+
+class ResultCache(ABC):
+    @abstractmethod
+    def get(self, key: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def put(self, key: str, results: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def clear(self):
+        pass
+
+
+class InMemoryResultCache(ResultCache):
+    def __init__(self, max_size: int = 10000, ttl: float = None):
+        # ttl: seconds before an entry expires (None: never expires)
+        self.ttl = ttl
+        self.cache = LRUCache(max_size=max_size)
+
+    def get(self, key: str) -> List[Dict[str, Any]]:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        expires_at, results = entry
+        if expires_at is not None and expires_at < time.time():
+            return None
+        # Return a copy so callers can modify the results freely
+        return copy.deepcopy(results)
+
+    def put(self, key: str, results: List[Dict[str, Any]]):
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        self.cache.put(key, (expires_at, copy.deepcopy(results)))
+
+    def clear(self):
+        self.cache.clear()
+
+
+class SQLiteResultCache(ResultCache):
+    def __init__(self, cache_path: str, ttl: float = None):
+        # ttl: seconds before an entry expires (None: never expires)
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def get(self, key: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            row = self.connection.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return None
+        return json.loads(value)
+
+    def put(self, key: str, results: List[Dict[str, Any]]):
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(results, ensure_ascii=False), expires_at),
+            )
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM results")
+
+    def purge_expired(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM results WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+
+
+class CachedRetriever(Retriever):
+    def __init__(self, retriever: Retriever, cache: ResultCache = None, namespace: str = ""):
+        self.retriever = retriever
+        self.cache = cache if cache is not None else InMemoryResultCache()
+        # Namespace separates retrievers sharing one (on-disk) cache
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    def _get_cache_key(self, corpus_version: str, corpus_name: str, query: str, top_k: int, candidate_ids: List[str]) -> str:
+        # Keyed on the corpus version, so adding documents to the collection invalidates stale entries
+        key = [self.namespace, corpus_name, corpus_version, query, top_k, sorted(candidate_ids) if candidate_ids is not None else None]
+        return hashlib.sha256(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def __call__(
+            self,
+            corpus_name: str,
+            query: str,
+            top_k: int = 3,
+            candidate_ids: List[str] = None,
+        ) -> List[Dict[str, Any]]:
+        return self.batch_search(corpus_name, [query], top_k=top_k, candidate_idss=[candidate_ids] if candidate_ids is not None else None)[0]
+
+    def batch_search(
+            self,
+            corpus_name: str,
+            queries: List[str],
+            top_k: int = 3,
+            candidate_idss: List[List[str]] = None,
+        ) -> List[List[Dict[str, Any]]]:
+        corpus_version = self.retriever.get_corpus_version(corpus_name)
+        # Retriever does not track its content version, results can not be cached safely
+        if corpus_version is None:
+            return self.retriever.batch_search(corpus_name, queries, top_k=top_k, candidate_idss=candidate_idss)
+        if candidate_idss is None:
+            candidate_idss = [None] * len(queries)
+
+        cache_keys = [
+            self._get_cache_key(corpus_version, corpus_name, query, top_k, candidate_ids)
+            for query, candidate_ids in zip(queries, candidate_idss)
+        ]
+        resultss = [self.cache.get(cache_key) for cache_key in cache_keys]
+        missing_indices = [index for index, results in enumerate(resultss) if results is None]
+        self.hits += len(queries) - len(missing_indices)
+        self.misses += len(missing_indices)
+        # Retrieve only the missing queries
+        if len(missing_indices) > 0:
+            missing_candidate_idss = [candidate_idss[index] for index in missing_indices]
+            missing_resultss = self.retriever.batch_search(
+                corpus_name,
+                [queries[index] for index in missing_indices],
+                top_k=top_k,
+                # Retrievers expect None (not a list of None) when no query is restricted to candidates
+                candidate_idss=missing_candidate_idss if any(candidate_ids is not None for candidate_ids in missing_candidate_idss) else None,
+            )
+            for index, results in zip(missing_indices, missing_resultss):
+                self.cache.put(cache_keys[index], results)
+                resultss[index] = results
+        return resultss
+
+    def get_corpus_version(self, corpus_name: str) -> str:
+        return self.retriever.get_corpus_version(corpus_name)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
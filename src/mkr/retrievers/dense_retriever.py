@@ -1,12 +1,15 @@
 import os
 import math
 import json
-from tqdm import trange
+import numpy as np
+from tqdm import tqdm
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
 from mkr.databases.vector_db import VectorDB
 from mkr.retrievers.baseclass import Retriever
-from mkr.utilities.general_utils import read_corpus
+from mkr.utilities.cache_utils import LRUCache
+from mkr.utilities.general_utils import iter_corpus, prefetch_iterator
 from mkr.models.retrieval.mE5 import mE5SentenceEncoder
 from mkr.models.retrieval.mUSE import mUSESentenceEncoder
 from mkr.models.retrieval.mDPR import mDPRSentenceEncoder
@@ -21,6 +24,21 @@ class DenseRetrieverConfig:
     model_name: str
     database_path: str
     model_checkpoint: str = None
+    index_factory: str = None
+    # Storage of passage embeddings: "float32", "float16", "int8" or "pq<M>" (e.g. "pq64")
+    storage: str = "float32"
+    max_tokens_per_batch: int = None
+    intra_op_threads: int = None
+    inter_op_threads: int = None
+    query_cache_size: int = 10000
+    query_cache_max_bytes: int = 64 * 1024 * 1024
+    # Runtime of the query encoder: "torch", "onnx" or "onnx_int8" (exported models are stored in onnx_dir)
+    query_backend: str = "torch"
+    onnx_dir: str = None
+    # Memory budget (bytes) of the loaded collections, least recently used ones are evicted (None: unlimited)
+    memory_budget: int = None
+    # Passage store shared with other retrievers on the same corpora (None: <database_path>/passage_store)
+    passage_store_path: str = None
 
 
 class DenseRetriever(Retriever):
@@ -28,11 +46,28 @@ class DenseRetriever(Retriever):
         self.model_name = config.model_name
         self.model_checkpoint = config.model_checkpoint
         self.database_path = config.database_path
+        self.index_factory = config.index_factory
+        self.storage = config.storage
+        self.max_tokens_per_batch = config.max_tokens_per_batch
+        self.intra_op_threads = config.intra_op_threads
+        self.inter_op_threads = config.inter_op_threads
+        self.query_cache_size = config.query_cache_size
+        self.query_cache_max_bytes = config.query_cache_max_bytes
+        self.query_backend = config.query_backend
+        self.onnx_dir = config.onnx_dir if config.onnx_dir is not None else os.path.join(self.database_path, "onnx", self.model_name)
+        self.memory_budget = config.memory_budget
+        self.passage_store_path = config.passage_store_path
 
         self.resource_manager = ResourceManager()
 
         self.encoder: SentenceEncoder = self._load_encoder(self.model_name, self.model_checkpoint)
-        self.vector_db = VectorDB(self.database_path)
+        # Group passages of similar length into token-budgeted batches
+        self.encoder.max_tokens_per_batch = self.max_tokens_per_batch
+        self.encoder.set_num_threads(intra_op_threads=self.intra_op_threads, inter_op_threads=self.inter_op_threads)
+        self.encoder.set_query_backend(self.query_backend, onnx_dir=self.onnx_dir, intra_op_threads=self.intra_op_threads, inter_op_threads=self.inter_op_threads)
+        self.vector_db = VectorDB(self.database_path, memory_budget=self.memory_budget, passage_store_path=self.passage_store_path)
+        # Cache of query embeddings, keyed by (model_name, model_checkpoint, query_backend, query)
+        self.query_cache = LRUCache(max_size=self.query_cache_size, max_bytes=self.query_cache_max_bytes)
 
     def _load_encoder(self, model_name: str, model_checkpoint: str = None) -> SentenceEncoder:
         # Load encoder
@@ -50,29 +85,84 @@ class DenseRetriever(Retriever):
             raise ValueError(f"Unknown encoder: {model_name}")
         return encoder
     
-    def add_corpus(self, corpus_name: str, corpus_path: str, batch_size: int = 32):
-        if corpus_name in self.vector_db.get_collection_names():
-            return
-        
-        vector_collection = self.vector_db.create_or_get_collection(corpus_name)
-        corpus = read_corpus(corpus_path)
-        for batch_idx in trange(math.ceil(len(corpus) / batch_size)):
-            batch_corpus = corpus[batch_idx * batch_size: (batch_idx + 1) * batch_size]
-            # Encode batch
-            batch_ids = [doc["id"] for doc in batch_corpus]
-            batch_contents = [doc["content"] for doc in batch_corpus]
-            batch_metadata = [None for doc in batch_corpus]
-            # batch_metadata = [doc["metadata"] for doc in batch_corpus]
-            # batch_titles = [metadata["title"] if "title" in metadata else None for metadata in batch_metadata]
-            # batch_contents = [f"{title}\n{content}" if title is not None else content for title, content in zip(batch_titles, batch_contents)]
-            batch_embeddings = self.encoder.encode_passages(batch_contents)
-            # Add to database
-            vector_collection.add(
-                ids=batch_ids,
-                contents=batch_contents,
-                vectors=batch_embeddings,
-                metadatas=batch_metadata,
-            )
+    def encode_queries(self, queries: List[str], batch_size: int = 32) -> np.ndarray:
+        # Look up cached query embeddings, only encode the misses (in batches)
+        cache_keys = [(self.model_name, self.model_checkpoint, self.query_backend, query) for query in queries]
+        cached_embeddings = [self.query_cache.get(cache_key) for cache_key in cache_keys]
+        missing_indices = [index for index, embedding in enumerate(cached_embeddings) if embedding is None]
+        for batch_idx in range(math.ceil(len(missing_indices) / batch_size)):
+            batch_indices = missing_indices[batch_idx * batch_size: (batch_idx + 1) * batch_size]
+            batch_embeddings = self.encoder.encode_queries([queries[index] for index in batch_indices])
+            for index, embedding in zip(batch_indices, batch_embeddings):
+                embedding = np.array(embedding, dtype=np.float32)
+                self.query_cache.put(cache_keys[index], embedding, nbytes=embedding.nbytes)
+                cached_embeddings[index] = embedding
+        return np.stack(cached_embeddings, axis=0)
+
+    def get_corpus_version(self, corpus_name: str) -> str:
+        return self.vector_db.create_or_get_collection(corpus_name).version
+
+    def add_corpus(
+            self, 
+            corpus_name: str, 
+            corpus_path: str, 
+            batch_size: int = 32, 
+            pipelined: bool = True, 
+            num_prefetch_batches: int = 4,
+        ):
+        # Existing collections are updated incrementally, only passages with new ids are encoded
+        vector_collection = self.vector_db.create_or_get_collection(corpus_name, index_factory=self.index_factory, storage=self.storage)
+        # With max_tokens_per_batch set, each chunk of batch_size passages is split into length-bucketed
+        # batches, so a larger batch_size (e.g. 1024) gives the bucketing more passages to group
+
+        def _read_and_prepare():
+            # Stream the corpus batch by batch and prepare (tokenize) the passages
+            for batch_corpus in iter_corpus(corpus_path, batch_size=batch_size):
+                batch_corpus = [doc for doc in batch_corpus if doc["id"] not in vector_collection.indexing]
+                if len(batch_corpus) == 0:
+                    continue
+                batch_ids = [doc["id"] for doc in batch_corpus]
+                batch_contents = [doc["content"] for doc in batch_corpus]
+                batch_metadata = [None for doc in batch_corpus]
+                # batch_metadata = [doc["metadata"] for doc in batch_corpus]
+                # batch_titles = [metadata["title"] if "title" in metadata else None for metadata in batch_metadata]
+                # batch_contents = [f"{title}\n{content}" if title is not None else content for title, content in zip(batch_titles, batch_contents)]
+                yield batch_ids, batch_contents, batch_metadata, self.encoder.prepare_passages(batch_contents)
+
+        batches = _read_and_prepare()
+        writer = None
+        pending_write = None
+        if pipelined:
+            # Producer thread reads and tokenizes upcoming batches, writer thread adds embeddings to the collection,
+            # so the encoder never waits on Python-side preparation
+            batches = prefetch_iterator(batches, max_prefetch=num_prefetch_batches)
+            writer = ThreadPoolExecutor(max_workers=1)
+        try:
+            for batch_ids, batch_contents, batch_metadata, prepared_passages in tqdm(batches, unit="batches"):
+                # Encode batch
+                batch_embeddings = self.encoder.encode_prepared_passages(prepared_passages)
+                # Add to database
+                add_kwargs = dict(
+                    ids=batch_ids,
+                    contents=batch_contents,
+                    vectors=batch_embeddings,
+                    metadatas=batch_metadata,
+                )
+                if writer is None:
+                    vector_collection.add(**add_kwargs)
+                else:
+                    # Keep at most one write in flight, which also keeps the rows in order
+                    if pending_write is not None:
+                        pending_write.result()
+                    pending_write = writer.submit(vector_collection.add, **add_kwargs)
+            if pending_write is not None:
+                pending_write.result()
+        finally:
+            # Stop reading ahead (and release the corpus file) if encoding failed part way
+            batches.close()
+            if writer is not None:
+                writer.shutdown(wait=True)
+        print(f"Padding efficiency: {self.encoder.get_padding_efficiency() * 100:.1f}%")
         # Save database
         self.vector_db.save()
 
@@ -81,19 +171,49 @@ class DenseRetriever(Retriever):
             corpus_name: str, 
             query: str, 
             top_k: int = 3, 
-            candidate_ids: List[str] = None
+            candidate_ids: List[str] = None,
+            nprobe: int = None,
+            ef_search: int = None,
         ) -> List[Dict[str, Any]]:
         vector_collection = self.vector_db.create_or_get_collection(corpus_name)
-        query_embedding = self.encoder.encode_queries(query)
+        query_embedding = self.encode_queries([query])
         # Retrieve documents
-        results = vector_collection.search(query_embedding, top_k=top_k, candidate_ids=candidate_ids)
+        results = vector_collection.search(query_embedding, top_k=top_k, candidate_ids=candidate_ids, nprobe=nprobe, ef_search=ef_search)
         return results
     
+    def batch_search(
+            self, 
+            corpus_name: str, 
+            queries: List[str], 
+            top_k: int = 3, 
+            candidate_idss: List[List[str]] = None,
+            batch_size: int = 32,
+            nprobe: int = None,
+            ef_search: int = None,
+        ) -> List[List[Dict[str, Any]]]:
+        vector_collection = self.vector_db.create_or_get_collection(corpus_name)
+        # Encode queries in batches
+        query_embeddings = self.encode_queries(queries, batch_size=batch_size)
+        # Retrieve documents for all queries at once
+        resultss = vector_collection.batch_search(query_embeddings, top_k=top_k, candidate_idss=candidate_idss, nprobe=nprobe, ef_search=ef_search)
+        return resultss
+    
     def save(self, path: str):
         # Save config
         config = {
             "model_name": self.model_name,
             "database_path": self.database_path,
+            "index_factory": self.index_factory,
+            "storage": self.storage,
+            "max_tokens_per_batch": self.max_tokens_per_batch,
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "query_cache_size": self.query_cache_size,
+            "query_cache_max_bytes": self.query_cache_max_bytes,
+            "query_backend": self.query_backend,
+            "onnx_dir": self.onnx_dir,
+            "memory_budget": self.memory_budget,
+            "passage_store_path": self.passage_store_path,
         }
         json.dump(config, open(os.path.join(path, "config.json"), "w"))
 
@@ -9,16 +9,14 @@ class HybridRetriever(Retriever):
         self.sparse_retriever = sparse_retriever
         self.sparse_weight = sparse_weight
 
-    def __call__(
-            self, 
-            corpus_name: str,
-            query: str, 
-            top_k: int = 3, 
-            candidate_ids: List[str] = None, 
-        ) -> List[Dict[str, Any]]:
-        dense_results: List[Dict[str, Any]] = self.dense_retriever(corpus_name, query, top_k=top_k, candidate_ids=candidate_ids)
-        sparse_results: List[Dict[str, Any]] = self.sparse_retriever(corpus_name, query, top_k=top_k, candidate_ids=candidate_ids)
+    def get_corpus_version(self, corpus_name: str) -> str:
+        dense_version = self.dense_retriever.get_corpus_version(corpus_name)
+        sparse_version = self.sparse_retriever.get_corpus_version(corpus_name)
+        if dense_version is None or sparse_version is None:
+            return None
+        return f"{dense_version}:{sparse_version}"
 
+    def _combine(self, dense_results: List[Dict[str, Any]], sparse_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         combined_results = {}
         for dense_result in dense_results:
             combined_results[dense_result["id"]] = {
@@ -43,4 +41,26 @@ class HybridRetriever(Retriever):
         combined_results = sorted(combined_results, key=lambda x: x["score"], reverse=True)
         # Normalize score
         combined_results = normalize_score(combined_results)
-        return combined_results
\ No newline at end of file
+        return combined_results
+
+    def __call__(
+            self, 
+            corpus_name: str,
+            query: str, 
+            top_k: int = 3, 
+            candidate_ids: List[str] = None, 
+        ) -> List[Dict[str, Any]]:
+        dense_results: List[Dict[str, Any]] = self.dense_retriever(corpus_name, query, top_k=top_k, candidate_ids=candidate_ids)
+        sparse_results: List[Dict[str, Any]] = self.sparse_retriever(corpus_name, query, top_k=top_k, candidate_ids=candidate_ids)
+        return self._combine(dense_results, sparse_results)
+
+    def batch_search(
+            self, 
+            corpus_name: str, 
+            queries: List[str], 
+            top_k: int = 3, 
+            candidate_idss: List[List[str]] = None,
+        ) -> List[List[Dict[str, Any]]]:
+        dense_resultss = self.dense_retriever.batch_search(corpus_name, queries, top_k=top_k, candidate_idss=candidate_idss)
+        sparse_resultss = self.sparse_retriever.batch_search(corpus_name, queries, top_k=top_k, candidate_idss=candidate_idss)
+        return [self._combine(dense_results, sparse_results) for dense_results, sparse_results in zip(dense_resultss, sparse_resultss)]
\ No newline at end of file
@@ -4,7 +4,7 @@ from typing import List, Dict, Any
 from mkr.models.mBERT import mBERTReranker
 from mkr.databases.corpus_db import CorpusDB
 from mkr.retrievers.baseclass import Retriever
-from mkr.utilities.general_utils import read_corpus
+from mkr.utilities.general_utils import iter_corpus
 from mkr.utilities.general_utils import normalize_score
 
 
@@ -12,15 +12,21 @@ from mkr.utilities.general_utils import normalize_score
 class RerankerConfig:
     model_name: str
     database_path: str
+    # Memory budget (bytes) of the loaded collections, least recently used ones are evicted (None: unlimited)
+    memory_budget: int = None
+    # Passage store shared with other retrievers on the same corpora (None: <database_path>/passage_store)
+    passage_store_path: str = None
 
 
 class Reranker(Retriever):
     def __init__(self, config: RerankerConfig):
         self.model_name = config.model_name
         self.database_path = config.database_path
+        self.memory_budget = config.memory_budget
+        self.passage_store_path = config.passage_store_path
 
         self.model = self._load_model(self.model_name)
-        self.corpus_db = CorpusDB(self.database_path)
+        self.corpus_db = CorpusDB(self.database_path, memory_budget=self.memory_budget, passage_store_path=self.passage_store_path)
 
     @staticmethod
     def _load_model(model_name: str):
@@ -31,18 +37,18 @@ class Reranker(Retriever):
             raise ValueError(f"Unknown model: {model_name}")
         return model
 
-    def add_corpus(self, corpus_name: str, corpus_path: str):
+    def add_corpus(self, corpus_name: str, corpus_path: str, batch_size: int = 1000):
         if corpus_name in self.corpus_db.get_collection_names():
             return
         
         corpus_collection = self.corpus_db.create_or_get_collection(corpus_name)
-        corpus = read_corpus(corpus_path)
-        for doc in tqdm(corpus):
+        # Stream the corpus batch by batch
+        for batch_corpus in tqdm(iter_corpus(corpus_path, batch_size=batch_size), unit="batches"):
             # Add to database
             corpus_collection.add(
-                ids=[doc["hash"]],
-                contents=[doc["content"]],
-                metadatas=[doc["metadata"]],
+                ids=[doc["hash"] for doc in batch_corpus],
+                contents=[doc["content"] for doc in batch_corpus],
+                metadatas=[doc["metadata"] for doc in batch_corpus],
             )
         # Save database
         self.corpus_db.save()
@@ -67,6 +73,16 @@ class Reranker(Retriever):
         # Normalize score
         results = normalize_score(results)
         return results
+
+    def batch_search(
+            self, 
+            corpus_name: str, 
+            queries: List[str], 
+            candidate_idss: List[List[str]],
+            top_k: int = 3, 
+        ) -> List[List[Dict[str, Any]]]:
+        # Cross-encoder scores each (query, document) pair, so rerank one query at a time
+        return [self(corpus_name, query, candidate_ids=candidate_ids, top_k=top_k) for query, candidate_ids in zip(queries, candidate_idss)]
     
 
 if __name__ == "__main__":
@@ -5,33 +5,46 @@ from dataclasses import dataclass
 from typing import List, Dict, Any
 from mkr.databases.bm25_db import BM25DB
 from mkr.retrievers.baseclass import Retriever
-from mkr.utilities.general_utils import read_corpus
+from mkr.utilities.general_utils import iter_corpus
 
 
 @dataclass
 class SparseRetrieverConfig:
     database_path: str
+    pruning: bool = False
+    token_cache_dir: str = None
+    # Memory budget (bytes) of the loaded collections, least recently used ones are evicted (None: unlimited)
+    memory_budget: int = None
+    # Passage store shared with other retrievers on the same corpora (None: <database_path>/passage_store)
+    passage_store_path: str = None
 
 
 class SparseRetriever(Retriever):
     def __init__(self, config: SparseRetrieverConfig):
         self.database_path = config.database_path
+        self.pruning = config.pruning
+        self.token_cache_dir = config.token_cache_dir
+        self.memory_budget = config.memory_budget
+        self.passage_store_path = config.passage_store_path
 
-        self.bm25_db = BM25DB(self.database_path)
+        self.bm25_db = BM25DB(self.database_path, token_cache_dir=self.token_cache_dir, memory_budget=self.memory_budget, passage_store_path=self.passage_store_path)
 
-    def add_corpus(self, corpus_name: str, corpus_path: str):
-        if corpus_name in self.bm25_db.get_collection_names():
-            return
-        
+    def get_corpus_version(self, corpus_name: str) -> str:
+        return self.bm25_db.get_collection(corpus_name).version
+
+    def add_corpus(self, corpus_name: str, corpus_path: str, num_workers: int = None, batch_size: int = 1000):
+        # Existing collections are updated incrementally, new documents are indexed into a new segment
         bm25_collection = self.bm25_db.create_or_get_collection(corpus_name)
-        corpus = read_corpus(corpus_path)
-        for doc in tqdm(corpus):
+        # Stream the corpus batch by batch
+        for batch_corpus in tqdm(iter_corpus(corpus_path, batch_size=batch_size), unit="batches"):
             bm25_collection.add(
-                ids=[doc["hash"]],
-                contents=[f"{doc['metadata']['title']}\n{doc['content']}"] if "title" in doc["metadata"] else [doc["content"]],
-                metadatas=[doc["metadata"]],
+                ids=[doc["hash"] for doc in batch_corpus],
+                # The title is prepended to the content at index time, the passage store keeps the content as is
+                contents=[doc["content"] for doc in batch_corpus],
+                metadatas=[doc["metadata"] for doc in batch_corpus],
             )
-        bm25_collection.create_engine()
+        # Tokenize with all available cores by default
+        bm25_collection.update_engine(num_workers=num_workers if num_workers is not None else os.cpu_count())
         # Save database
         self.bm25_db.save()
 
@@ -44,13 +57,29 @@ class SparseRetriever(Retriever):
         ) -> List[Dict[str, Any]]:
         bm25_collection = self.bm25_db.get_collection(corpus_name)
         # Retrieve documents
-        results = bm25_collection.search(query, top_k=top_k, candidate_ids=candidate_ids)
+        results = bm25_collection.search(query, top_k=top_k, candidate_ids=candidate_ids, pruning=self.pruning)
         return results
 
+    def batch_search(
+            self, 
+            corpus_name: str, 
+            queries: List[str], 
+            top_k: int = 3, 
+            candidate_idss: List[List[str]] = None,
+        ) -> List[List[Dict[str, Any]]]:
+        bm25_collection = self.bm25_db.get_collection(corpus_name)
+        # Retrieve documents
+        resultss = bm25_collection.batch_search(queries, top_k=top_k, candidate_idss=candidate_idss, pruning=self.pruning)
+        return resultss
+
     def save(self, path: str):
         # Save config
         config = {
             "database_path": self.database_path,
+            "pruning": self.pruning,
+            "token_cache_dir": self.token_cache_dir,
+            "memory_budget": self.memory_budget,
+            "passage_store_path": self.passage_store_path,
         }
         json.dump(config, open(os.path.join(path, "config.json"), "w"))
 
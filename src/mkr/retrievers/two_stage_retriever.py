@@ -17,4 +17,16 @@ class TwoStageRetriever(Retriever):
         results = self.retriever(corpus_name, query, top_k=top_ks[0], candidate_ids=candidate_ids)
         candidate_ids = [result["id"] for result in results]
         results = self.reranker(corpus_name, query, candidate_ids=candidate_ids, top_k=top_ks[1])
-        return results
\ No newline at end of file
+        return results
+
+    def batch_search(
+            self, 
+            corpus_name: str, 
+            queries: List[str], 
+            top_ks: List[int] = (100, 3), 
+            candidate_idss: List[List[str]] = None
+        ) -> List[List[Dict[str, Any]]]:
+        resultss = self.retriever.batch_search(corpus_name, queries, top_k=top_ks[0], candidate_idss=candidate_idss)
+        candidate_idss = [[result["id"] for result in results] for results in resultss]
+        resultss = self.reranker.batch_search(corpus_name, queries, candidate_idss=candidate_idss, top_k=top_ks[1])
+        return resultss
\ No newline at end of file
@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+
+class LRUCache:
+    # Thread-safe LRU cache bounded by number of entries and (optionally) total size in bytes
+    def __init__(self, max_size: int = 1024, max_bytes: int = None):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # {key: (value, nbytes)}
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int = 0):
+        # Entries larger than the whole budget are not cached
+        if self.max_size <= 0 or (self.max_bytes is not None and nbytes > self.max_bytes):
+            return
+        with self.lock:
+            if key in self.entries:
+                self.num_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, nbytes)
+            self.num_bytes += nbytes
+            # Evict least recently used entries
+            while len(self.entries) > self.max_size or (self.max_bytes is not None and self.num_bytes > self.max_bytes):
+                self.num_bytes -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.num_bytes = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self.entries),
+            "bytes": self.num_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -1,18 +1,128 @@
 import math
 import json
-from typing import List, Dict, Any
+import hashlib
+import threading
+import numpy as np
+from queue import Queue, Full
+from typing import List, Dict, Any, Iterator, Union
 
+# Optional fast JSON parser
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def read_corpus(corpus_dir: str):
-    corpus: List[Dict[str, str]] = []
-    with open(corpus_dir, "r", encoding="utf-8") as f:
+
+def _parse_json_line(line: bytes, fast_json: bool = True) -> Dict[str, Any]:
+    if fast_json and orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+def iter_corpus(
+        corpus_dir: str, 
+        batch_size: int = None, 
+        fast_json: bool = True,
+    ) -> Iterator[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+    # Stream documents (or batches of documents) without materializing the whole corpus
+    batch: List[Dict[str, Any]] = []
+    with open(corpus_dir, "rb") as f:
         for line in f:
-            data = json.loads(line)
-            corpus.append(data)
+            if not line.strip():
+                continue
+            data = _parse_json_line(line, fast_json=fast_json)
+            if batch_size is None:
+                yield data
+                continue
+            batch.append(data)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if len(batch) > 0:
+        yield batch
+
+def read_corpus(corpus_dir: str):
+    corpus: List[Dict[str, str]] = list(iter_corpus(corpus_dir))
     return corpus
 
+def index_corpus_offsets(corpus_dir: str) -> np.ndarray:
+    # Byte offset of every document line, for random access with read_corpus_lines()
+    offsets = []
+    with open(corpus_dir, "rb") as f:
+        offset = 0
+        for line in f:
+            if line.strip():
+                offsets.append(offset)
+            offset += len(line)
+    return np.array(offsets, dtype=np.int64)
+
+def read_corpus_lines(corpus_dir: str, offsets: np.ndarray, indices: List[int], fast_json: bool = True) -> List[Dict[str, Any]]:
+    docs: List[Dict[str, Any]] = []
+    with open(corpus_dir, "rb") as f:
+        for index in indices:
+            f.seek(offsets[index])
+            docs.append(_parse_json_line(f.readline(), fast_json=fast_json))
+    return docs
+
+def prefetch_iterator(iterator: Iterator[Any], max_prefetch: int = 4) -> Iterator[Any]:
+    # Run the iterator in a background thread, keeping up to max_prefetch items ready ahead of the consumer
+    queue = Queue(maxsize=max_prefetch)
+    end_of_iterator = object()
+    errors = []
+    # Set when the consumer stops early, so the producer does not block on a full queue forever
+    stopped = threading.Event()
+
+    def _put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterator:
+                if not _put(item):
+                    break
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            # Release the source (e.g. its open file) when the consumer stopped early
+            if stopped.is_set() and hasattr(iterator, "close"):
+                iterator.close()
+            _put(end_of_iterator)
+
+    threading.Thread(target=_produce, daemon=True).start()
+    try:
+        while True:
+            item = queue.get()
+            if item is end_of_iterator:
+                break
+            yield item
+    finally:
+        stopped.set()
+    # Re-raise errors from the background thread
+    if len(errors) > 0:
+        raise errors[0]
+
 def normalize_score(results: List[Dict[str, Any]]):
     sum_score = sum([math.exp(result["score"]) for result in results])
     for result in results:
         result["score"] = math.exp(result["score"]) / sum_score
-    return results
\ No newline at end of file
+    return results
+
+def get_topk_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    # Partial selection of the top-k entries, then sort only those
+    if top_k < len(scores):
+        topk_indices = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        topk_indices = np.arange(len(scores))
+    return topk_indices[np.argsort(-scores[topk_indices], kind="stable")]
+
+def file_checksum(file_path: str, chunk_size: int = 1 << 24) -> str:
+    checksum = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            checksum.update(chunk)
+    return checksum.hexdigest()
\ No newline at end of file
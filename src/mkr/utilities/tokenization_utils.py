@@ -0,0 +1,42 @@
+import os
+import time
+import multiprocessing
+from tqdm import tqdm
+from typing import List
+from functools import partial
+from pythainlp.tokenize import word_tokenize
+
+
+def _tokenize_chunk(texts: List[str], tokenizer_name: str) -> List[List[str]]:
+    return [word_tokenize(text, engine=tokenizer_name) for text in texts]
+
+def parallel_tokenize(
+        texts: List[str], 
+        tokenizer_name: str = "newmm", 
+        num_workers: int = None, 
+        chunk_size: int = 1000,
+    ) -> List[List[str]]:
+    # Tokenize texts in chunks over a process pool, chunks are reassembled in the original order
+    num_workers = num_workers if num_workers is not None else os.cpu_count()
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+
+    start_time = time.time()
+    tokenized_texts = []
+    with tqdm(total=len(texts), desc="Tokenizing", unit="docs") as progress_bar:
+        if num_workers <= 1 or len(chunks) <= 1:
+            tokenized_chunks = map(partial(_tokenize_chunk, tokenizer_name=tokenizer_name), chunks)
+            for tokenized_chunk in tokenized_chunks:
+                tokenized_texts.extend(tokenized_chunk)
+                progress_bar.update(len(tokenized_chunk))
+        else:
+            with multiprocessing.Pool(min(num_workers, len(chunks))) as pool:
+                tokenized_chunks = pool.imap(partial(_tokenize_chunk, tokenizer_name=tokenizer_name), chunks)
+                for tokenized_chunk in tokenized_chunks:
+                    tokenized_texts.extend(tokenized_chunk)
+                    progress_bar.update(len(tokenized_chunk))
+    # Report throughput
+    elapsed_time = max(time.time() - start_time, 1e-9)
+    num_tokens = sum(len(tokens) for tokens in tokenized_texts)
+    print(f"Tokenized {len(texts)} documents ({num_tokens} tokens) in {elapsed_time:.1f}s "
+          f"with {num_workers} workers: {len(texts) / elapsed_time:.1f} docs/s, {num_tokens / elapsed_time:.1f} tokens/s")
+    return tokenized_texts
@@ -0,0 +1,99 @@
+import os
+import json
+import numpy as np
+import pytest
+import rank_bm25
+from mkr.databases.bm25_db import BM25Collection
+from mkr.databases.bm25_engine import BM25Engine
+
+
+def get_random_corpus(seed: int, num_docs: int = 200, vocab_size: int = 50):
+    # Zipf-like term distribution, so some terms are common enough to get negative Okapi idfs
+    rng = np.random.default_rng(seed)
+    probs = 1 / np.arange(1, vocab_size + 1)
+    probs /= probs.sum()
+    return [[f"t{term}" for term in rng.choice(vocab_size, size=rng.integers(1, 30), p=probs)] for _ in range(num_docs)]
+
+
+@pytest.mark.parametrize("variant, rank_bm25_class", [
+    ("bm25_okapi", rank_bm25.BM25Okapi),
+    ("bm25_plus", rank_bm25.BM25Plus),
+    ("bm25_l", rank_bm25.BM25L),
+])
+def test_scores_match_rank_bm25(variant, rank_bm25_class):
+    corpus = get_random_corpus(0)
+    engine = BM25Engine.from_tokenized_corpus(corpus, variant=variant)
+    reference = rank_bm25_class(corpus)
+    for query in [["t0"], ["t1", "t7", "t7"], ["t3", "t20", "oov"]]:
+        # BM25+ drops the constant idf * delta per query term, which does not change the ranking
+        diff = engine.get_scores(query) - reference.get_scores(query)
+        np.testing.assert_allclose(diff, diff[0], atol=1e-4)
+        if variant != "bm25_plus":
+            np.testing.assert_allclose(diff, 0, atol=1e-4)
+
+
+@pytest.mark.parametrize("variant", ["bm25_okapi", "bm25_plus", "bm25_l"])
+def test_maxscore_matches_exhaustive_search(variant):
+    engine = BM25Engine.from_tokenized_corpus(get_random_corpus(1), variant=variant)
+    rng = np.random.default_rng(2)
+    for _ in range(50):
+        query = [f"t{term}" for term in rng.integers(0, 60, size=rng.integers(1, 6))]
+        top_k = int(rng.integers(1, 20))
+        scores, _ = engine.search(query, top_k=top_k)
+        pruned_scores, pruned_indices = engine.search(query, top_k=top_k, pruning=True)
+        # Pruning only returns documents matching a query term
+        num_matched = int((engine.get_scores(query) != 0).sum())
+        assert len(pruned_scores) == min(top_k, num_matched)
+        np.testing.assert_allclose(pruned_scores, scores[:len(pruned_scores)], rtol=1e-5)
+        np.testing.assert_allclose(engine.get_batch_scores(query, pruned_indices), pruned_scores, rtol=1e-5)
+
+
+def test_background_merge_is_saved(tmp_path):
+    collection_path = str(tmp_path / "collection")
+    collection = BM25Collection(collection_path, engine_params={"max_segments": 2})
+    for index, content in enumerate(["แมว กิน ปลา", "หมา กิน กระดูก", "นก กิน หนอน"]):
+        collection.add([str(index)], [content], [{}])
+        collection.update_engine()
+    collection.save()
+    # A merge finishing after the save is persisted by the next save
+    collection.engine.wait_for_merge()
+    collection.save()
+
+    engine_path = os.path.join(collection_path, "engine")
+    segment_names = json.load(open(os.path.join(engine_path, "segments.json"), "r"))["segments"]
+    assert len(segment_names) == 1
+    assert sorted(name for name in os.listdir(engine_path) if name.startswith("segment_")) == segment_names
+    reloaded = BM25Collection(collection_path)
+    assert reloaded.search("หนอน", top_k=1)[0]["id"] == "2"
+
+
+def test_delete_compact_and_reload(tmp_path):
+    collection_path = str(tmp_path / "collection")
+    contents = ["แมว กิน ปลา", "หมา กิน กระดูก", "นก กิน หนอน", "แมว นอน บน หลังคา", "ปลา ว่าย น้ำ", "นก บิน บน ฟ้า"]
+    ids = [str(index) for index in range(len(contents))]
+    collection = BM25Collection(collection_path)
+    collection.add(ids, contents, [{}] * len(contents))
+    collection.update_engine()
+    collection.save()
+
+    collection.delete(["0"])
+    for pruning in [False, True]:
+        results = collection.search("แมว", top_k=len(contents), pruning=pruning)
+        assert results[0]["id"] == "3" and "0" not in [result["id"] for result in results]
+    collection.save()
+    # Tombstones are persisted
+    reloaded = BM25Collection(collection_path)
+    results = reloaded.search("แมว", top_k=len(contents))
+    assert results[0]["id"] == "3" and "0" not in [result["id"] for result in results]
+
+    reloaded.compact()
+    reloaded.save()
+    compacted = BM25Collection(collection_path)
+    assert compacted.ids == ids[1:]
+    assert len(compacted.tombstones) == 0
+    assert [result["id"] for result in compacted.search("แมว", top_k=len(contents))][0] == "3"
+    # Same scores as an engine built over the remaining documents only
+    expected = BM25Collection(str(tmp_path / "expected"))
+    expected.add(ids[1:], contents[1:], [{}] * (len(contents) - 1))
+    for query in ["แมว", "กิน หนอน"]:
+        np.testing.assert_allclose(compacted.get_engine().get_scores(query.split()), expected.get_engine().get_scores(query.split()), rtol=1e-6)
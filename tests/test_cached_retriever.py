@@ -0,0 +1,53 @@
+import json
+import torch
+import zlib
+from typing import List
+from mkr.models.retrieval.baseclass import SentenceEncoder
+from mkr.retrievers.cached_retriever import CachedRetriever
+from mkr.retrievers.dense_retriever import DenseRetriever, DenseRetrieverConfig
+
+
+class StubEncoder(SentenceEncoder):
+    # Normalized bag of hashed words, so texts sharing words are close
+    def _encode(self, texts: List[str]) -> torch.Tensor:
+        embeddings = torch.zeros(len(texts), 128)
+        for index, text in enumerate(texts):
+            for word in text.split():
+                embeddings[index, zlib.crc32(word.encode("utf-8")) % 128] += 1.0
+        return torch.nn.functional.normalize(embeddings, dim=1)
+
+    def _encode_queries(self, queries: List[str]) -> torch.Tensor:
+        return self._encode(queries)
+
+    def _encode_passages(self, passages: List[str]) -> torch.Tensor:
+        return self._encode(passages)
+
+
+class StubDenseRetriever(DenseRetriever):
+    def _load_encoder(self, model_name: str, model_checkpoint: str = None) -> SentenceEncoder:
+        return StubEncoder()
+
+
+def _create_retriever(tmp_path) -> DenseRetriever:
+    corpus_path = tmp_path / "corpus.jsonl"
+    with open(corpus_path, "w", encoding="utf-8") as f:
+        for index, content in enumerate(["red apple", "green pear", "yellow banana", "red cherry"]):
+            f.write(json.dumps({"id": str(index), "content": content, "metadata": {}}) + "\n")
+    retriever = StubDenseRetriever(DenseRetrieverConfig(model_name="stub", database_path=str(tmp_path / "database")))
+    retriever.add_corpus("fruits", str(corpus_path), pipelined=False)
+    return retriever
+
+
+def test_cached_dense_retriever_without_candidates(tmp_path):
+    retriever = CachedRetriever(_create_retriever(tmp_path))
+    results = retriever("fruits", "green pear", top_k=1)
+    assert results[0]["content"] == "green pear"
+    assert retriever("fruits", "green pear", top_k=1) == results
+    assert retriever.get_stats() == {"hits": 1, "misses": 1}
+
+
+def test_cached_dense_retriever_with_mixed_candidates(tmp_path):
+    retriever = CachedRetriever(_create_retriever(tmp_path))
+    resultss = retriever.batch_search("fruits", ["red apple", "red apple"], top_k=1, candidate_idss=[None, ["2", "3"]])
+    assert resultss[0][0]["content"] == "red apple"
+    assert resultss[1][0]["content"] == "red cherry"
@@ -0,0 +1,26 @@
+from mkr.databases.corpus_db import CorpusDB
+
+
+def test_delete_compact_and_reload(tmp_path):
+    db = CorpusDB(str(tmp_path / "database"))
+    collection = db.create_or_get_collection("corpus")
+    collection.add(["0", "1", "2"], ["passage 0", "passage 1", "passage 2"], [{"title": "0"}, {"title": "1"}, {"title": "2"}])
+    db.save()
+
+    collection.delete(["1"])
+    assert collection.retrieve(["1"]) is None
+    db.save()
+    # Tombstones are persisted
+    reloaded = CorpusDB(str(tmp_path / "database")).get_collection("corpus")
+    assert reloaded.retrieve(["1"]) is None
+    assert len(reloaded.tombstones) == 1
+
+    reloaded.compact()
+    reloaded.save()
+    compacted = CorpusDB(str(tmp_path / "database")).get_collection("corpus")
+    assert compacted.ids == ["0", "2"]
+    assert len(compacted.tombstones) == 0
+    assert compacted.retrieve(["0", "2"]) == [
+        {"id": "0", "content": "passage 0", "metadata": {"title": "0"}},
+        {"id": "2", "content": "passage 2", "metadata": {"title": "2"}},
+    ]
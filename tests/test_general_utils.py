@@ -0,0 +1,28 @@
+import time
+import threading
+from mkr.utilities.general_utils import prefetch_iterator
+
+
+def test_prefetch_iterator_stops_producer_when_consumer_stops_early():
+    closed = threading.Event()
+
+    def _source():
+        try:
+            for index in range(1000):
+                yield index
+        finally:
+            closed.set()
+
+    num_threads = threading.active_count()
+    batches = prefetch_iterator(_source(), max_prefetch=2)
+    assert next(batches) == 0
+    batches.close()
+    assert closed.wait(timeout=5)
+    deadline = time.time() + 5
+    while threading.active_count() > num_threads and time.time() < deadline:
+        time.sleep(0.01)
+    assert threading.active_count() == num_threads
+
+
+def test_prefetch_iterator_yields_all_items():
+    assert list(prefetch_iterator(iter(range(10)), max_prefetch=2)) == list(range(10))
@@ -0,0 +1,27 @@
+import torch
+import pytest
+import numpy as np
+from mkr.models.retrieval.onnx_backend import ONNXEncoderBackend
+
+pytest.importorskip("onnxruntime")
+transformers = pytest.importorskip("transformers")
+
+
+def _create_model(seed: int):
+    torch.manual_seed(seed)
+    config = transformers.BertConfig(vocab_size=32, hidden_size=16, num_hidden_layers=1, num_attention_heads=2, intermediate_size=32)
+    return transformers.BertModel(config).eval()
+
+
+def _tokenizer(texts, return_tensors="pt"):
+    return {"input_ids": torch.tensor([[1, 2, 3]]), "attention_mask": torch.ones(1, 3, dtype=torch.int64)}
+
+
+def test_export_of_another_checkpoint_is_not_reused(tmp_path):
+    inputs = {"input_ids": np.array([[1, 5, 7]]), "attention_mask": np.ones((1, 3), dtype=np.int64)}
+    for seed in [0, 1]:
+        model = _create_model(seed)
+        backend = ONNXEncoderBackend.from_model(model, _tokenizer, str(tmp_path / "onnx"), quantize=False)
+        with torch.inference_mode():
+            expected = model(input_ids=torch.tensor(inputs["input_ids"]), attention_mask=torch.tensor(inputs["attention_mask"]))[0].numpy()
+        np.testing.assert_allclose(backend(inputs), expected, atol=1e-5)
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+from mkr.databases.corpus_db import CorpusDB
+from mkr.databases.vector_db import VectorDB
+from mkr.databases.passage_store import PassageStore
+
+
+def test_collections_with_overlapping_ids(tmp_path):
+    vectors = np.eye(2, 16, dtype=np.float32)
+    db = VectorDB(str(tmp_path / "database"))
+    db.create_or_get_collection("iapp").add(["0", "1"], ["iapp passage 0", "iapp passage 1"], vectors, [None, None])
+    db.create_or_get_collection("xquad").add(["0", "1"], ["xquad passage 0", "xquad passage 1"], vectors, [None, None])
+    assert db.get_collection("xquad").search(vectors[:1], top_k=1)[0]["content"] == "xquad passage 0"
+    db.save()
+
+    reloaded = VectorDB(str(tmp_path / "database"))
+    assert reloaded.get_collection("iapp").search(vectors[:1], top_k=1)[0]["content"] == "iapp passage 0"
+    assert reloaded.get_collection("xquad").search(vectors[:1], top_k=1)[0]["content"] == "xquad passage 0"
+
+
+def test_upsert_replaces_content(tmp_path):
+    vectors = np.eye(4, 16, dtype=np.float32)
+    db = VectorDB(str(tmp_path / "database"))
+    collection = db.create_or_get_collection("docs")
+    collection.add([f"d{i}" for i in range(4)], [f"text {i}" for i in range(4)], vectors, [None] * 4)
+    collection.upsert(["d3"], ["CORRECTED text 3"], vectors[3:], [None])
+    assert collection.search(vectors[3:], top_k=1)[0]["content"] == "CORRECTED text 3"
+    db.save()
+
+    reloaded = VectorDB(str(tmp_path / "database"))
+    assert reloaded.get_collection("docs").search(vectors[3:], top_k=1)[0]["content"] == "CORRECTED text 3"
+
+
+def test_passages_are_loaded_on_first_use(tmp_path):
+    db = CorpusDB(str(tmp_path / "database"))
+    db.create_or_get_collection("docs").add(["a"], ["passage a"], [{"title": "A"}])
+    db.save()
+    store_path = os.path.abspath(db.passage_store_path)
+    del db
+    assert store_path not in PassageStore.stores
+
+    reloaded = CorpusDB(str(tmp_path / "database"))
+    assert not reloaded.passage_store.loaded
+    assert reloaded.get_collection("docs").retrieve(["a"])[0]["content"] == "passage a"
+    assert reloaded.passage_store.loaded
+
+
+def test_partial_append_is_repaired_by_the_writer(tmp_path):
+    db = CorpusDB(str(tmp_path / "database"))
+    db.create_or_get_collection("docs").add(["a"], ["passage a"], [None])
+    db.save()
+    passages_path = os.path.join(db.passage_store_path, "passages.jsonl")
+    with open(passages_path, "ab") as f:
+        f.write(b'{"hash": "interrupted')
+    size = os.path.getsize(passages_path)
+
+    # Readers ignore the partial line and leave the file as is
+    reader = PassageStore(db.passage_store_path)
+    assert reader.contents == ["passage a"]
+    assert os.path.getsize(passages_path) == size
+
+    db.get_collection("docs").add(["b"], ["passage b"], [None])
+    db.save()
+    assert PassageStore(db.passage_store_path).contents == ["passage a", "passage b"]
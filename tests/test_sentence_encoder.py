@@ -0,0 +1,20 @@
+import torch
+import pytest
+from typing import List
+from mkr.models.retrieval.baseclass import SentenceEncoder
+
+
+class LengthEncoder(SentenceEncoder):
+    # Embeds each text as its length, so the order of the outputs is visible
+    def _encode_queries(self, queries: List[str]) -> torch.Tensor:
+        return self._encode_passages(queries)
+
+    def _encode_passages(self, passages: List[str]) -> torch.Tensor:
+        return torch.tensor([[float(len(passage))] for passage in passages])
+
+
+@pytest.mark.parametrize("max_tokens_per_batch", [None, 4, 100000])
+def test_bucketed_passages_keep_their_order(max_tokens_per_batch):
+    encoder = LengthEncoder()
+    encoder.max_tokens_per_batch = max_tokens_per_batch
+    assert encoder.encode_passages(["aaaa", "a", "aaa"])[:, 0].tolist() == [4, 1, 3]
@@ -0,0 +1,22 @@
+import json
+import pytest
+import numpy as np
+from mkr.databases.token_cache import TokenCache
+
+
+def test_interrupted_overwrite_does_not_match_the_old_corpus(tmp_path, monkeypatch):
+    cache = TokenCache(str(tmp_path / "token_cache"))
+    cache.save("corpus", "newmm", "old", np.array([0]), np.array([0, 1]), ["old"])
+
+    # Interrupt the overwrite after the arrays are written, before cache.json
+    real_dump = json.dump
+    def interrupted_dump(obj, *args, **kwargs):
+        if isinstance(obj, dict) and "corpus_checksum" in obj:
+            raise KeyboardInterrupt
+        real_dump(obj, *args, **kwargs)
+    monkeypatch.setattr(json, "dump", interrupted_dump)
+    with pytest.raises(KeyboardInterrupt):
+        cache.save("corpus", "newmm", "new", np.array([1]), np.array([0, 1]), ["new"])
+    monkeypatch.undo()
+
+    assert cache.load("corpus", "newmm", "old") is None
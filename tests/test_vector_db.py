@@ -0,0 +1,78 @@
+import os
+import faiss
+import numpy as np
+from mkr.databases.vector_db import VectorCollection, VectorDB
+
+
+def _create_collection(collection_path, index_factory=None, num_docs=2000, dim=16):
+    vectors = np.random.RandomState(0).rand(num_docs, dim).astype(np.float32)
+    collection = VectorCollection(str(collection_path), index_factory=index_factory)
+    collection.add([str(i) for i in range(num_docs)], [f"text {i}" for i in range(num_docs)], vectors, [None] * num_docs)
+    return collection, vectors
+
+
+def test_search_params_do_not_leak_into_later_searches(tmp_path):
+    collection, vectors = _create_collection(tmp_path / "collection", index_factory="IVF16,Flat")
+    default_results = collection.search(vectors[:1], top_k=5)
+    collection.search(vectors[:1], top_k=5, nprobe=16)
+    assert faiss.extract_index_ivf(collection.default_engine).nprobe == 1
+    assert collection.search(vectors[:1], top_k=5) == default_results
+
+
+def test_writes_through_evicted_collection_are_saved(tmp_path):
+    vectors = np.random.RandomState(0).rand(2, 16).astype(np.float32)
+    db = VectorDB(str(tmp_path / "database"), memory_budget=1)
+    b = db.create_or_get_collection("b")
+    b.add(["early"], ["early text"], vectors[:1], [None])
+    db.save()
+    # Opening another collection evicts "b", which the caller still holds
+    db.create_or_get_collection("a").add(["other"], ["other text"], vectors[:1], [None])
+    assert "b" not in db.collections
+    b.add(["late"], ["late text"], vectors[1:], [None])
+    db.save()
+    assert db.get_collection("b") is b
+
+    reloaded = VectorDB(str(tmp_path / "database"))
+    assert list(reloaded.get_collection("b").ids) == ["early", "late"]
+
+
+def _get_file_states(path):
+    return {
+        os.path.join(root, name): os.stat(os.path.join(root, name)).st_mtime_ns
+        for root, _, names in os.walk(path) for name in names
+    }
+
+
+def test_read_only_database_does_not_write(tmp_path):
+    vectors = np.random.RandomState(0).rand(2, 16).astype(np.float32)
+    db = VectorDB(str(tmp_path / "database"))
+    for name in ["a", "b"]:
+        db.create_or_get_collection(name).add(["0", "1"], [f"{name} 0", f"{name} 1"], vectors, [None, None])
+    db.save()
+    file_states = _get_file_states(str(tmp_path / "database"))
+
+    # Searching alternately evicts the collections under the budget
+    reader = VectorDB(str(tmp_path / "database"), memory_budget=1)
+    for name in ["a", "b", "a", "b"]:
+        assert reader.get_collection(name).search(vectors[:1], top_k=1)[0]["content"] == f"{name} 0"
+    reader.save()
+    assert _get_file_states(str(tmp_path / "database")) == file_states
+
+
+def test_ids_are_appended_on_save(tmp_path):
+    vectors = np.eye(4, 16, dtype=np.float32)
+    collection = VectorCollection(str(tmp_path / "collection"))
+    collection.add(["0", "1"], ["text 0", "text 1"], vectors[:2], [None, None])
+    collection.save()
+    ids_path = os.path.join(str(tmp_path / "collection"), "ids.jsonl")
+    inode, size = os.stat(ids_path).st_ino, os.path.getsize(ids_path)
+    # A partial line left by an interrupted save is dropped by the next one
+    with open(ids_path, "ab") as f:
+        f.write(b'"interr')
+
+    collection.add(["2", "3"], ["text 2", "text 3"], vectors[2:], [None, None])
+    collection.save()
+    assert os.stat(ids_path).st_ino == inode and os.path.getsize(ids_path) > size
+    reloaded = VectorCollection(str(tmp_path / "collection"))
+    assert list(reloaded.ids) == ["0", "1", "2", "3"]
+    assert reloaded.search(vectors[3:], top_k=1)[0]["content"] == "text 3"